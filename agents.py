@@ -1,13 +1,23 @@
 """
 A set of AI agents that can play tic-tac-toe.
 """
+import collections
+import concurrent.futures
 import copy
 import dataclasses
+import enum
 import math
 import random
-from typing import Dict, List
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, Dict, Hashable, List, Set, Tuple
 
-from game import Board, Mark, Point
+from game import (
+    Board, BoardSymmetries, Mark, Point, get_board_symmetries, get_cell_index,
+    get_cell_points)
+
+if TYPE_CHECKING:
+    from array_tree import ArrayTree
 
 
 @dataclasses.dataclass(frozen=True)
@@ -23,14 +33,87 @@ class GameState:
     def __init__(self, board: Board, player: Mark):
         self.board = copy.deepcopy(board)
         self.player = copy.deepcopy(player)
+        # The game's result is tracked incrementally as moves are made, so we
+        # only need to scan the whole board once here
+        self.winner = self._find_winner()
+        self.num_empty = len(self.board.get_available_spaces())
+        self.move_count = self.board.board_size ** self.board.num_dimensions - self.num_empty
+        self.last_move = None
+        # What apply_action() changed, so undo_action() can restore it
+        self._history = []
+
+    def _find_winner(self) -> Mark:
+        for player in self.get_all_players():
+            if self.board.check_if_win_anywhere(player):
+                return player
+        return None
+
+    def _copy(self, player: Mark) -> "GameState":
+        """
+        Get a copy of this state with the given player to move, without
+        rescanning the board
+        """
+        new_state = GameState.__new__(GameState)
+        new_state.__dict__.update(self.__dict__)
+        new_state.board = copy.deepcopy(self.board)
+        new_state.player = player
+        new_state._history = []
+        return new_state
+
+    def copy(self) -> "GameState":
+        return self._copy(self.player)
+
+    def apply_action(self, action: Action):
+        """
+        Make the given move on this state in place, without copying the board.
+        It can be taken back with ``undo_action()``.
+        """
+        previous_mark = self.board.get_mark(action.pos)
+        self._history.append(
+            (action, previous_mark, self.player, self.winner, self.last_move))
+        if previous_mark == Mark.BLANK:
+            self.num_empty -= 1
+            self.move_count += 1
+        if self.board.set_mark(action.pos, action.player):
+            self.winner = action.player
+        self.player = self.get_next_player(action.player)
+        self.last_move = action
+
+    def undo_action(self):
+        """
+        Take back the most recent move made with ``apply_action()``.
+        """
+        action, previous_mark, self.player, self.winner, self.last_move = self._history.pop()
+        self.board.set_mark(action.pos, previous_mark)
+        if previous_mark == Mark.BLANK:
+            self.num_empty += 1
+            self.move_count -= 1
 
     def get_next_state(self, action: Action) -> "GameState":
-        if not action:
-            return GameState(self.board, self.player)
-        new_state = GameState(self.board, self.get_next_player(action.player))
-        new_state.board.set_mark(action.pos, action.player)
+        new_state = self.copy()
+        if action:
+            new_state.apply_action(action)
+            # The new state is independent, so there's nothing to undo
+            new_state._history.clear()
         return new_state
 
+    def get_hash(self) -> Hashable:
+        """
+        Get a key identifying this position (the board and who's moving), which
+        is the same regardless of the order the moves were made in.
+        """
+        return (self.board.zobrist_hash, self.player)
+
+    def get_hash_after(self, action: Action) -> Hashable:
+        """
+        Get the key ``get_hash()`` would return after taking the given action,
+        without taking it.
+        """
+        return (
+            self.board.get_hash_with_mark(action.pos, action.player),
+            self.get_next_player(action.player)
+        )
+
     def get_next_player(self, current_player: Mark) -> Mark:
         if current_player == Mark.X:
             return Mark.O
@@ -51,32 +134,68 @@ class GameState:
             for pos in self.board.get_available_spaces()
         ]
 
+    def get_symmetries(self) -> BoardSymmetries:
+        return get_board_symmetries(self.board.board_size, self.board.num_dimensions)
+
+    def get_unique_actions(self) -> List[Action]:
+        """
+        Get the available actions, keeping only one of each group of actions
+        that lead to symmetric (rotated/reflected) positions.
+        """
+        if self.is_terminal():
+            return []
+        return [
+            Action(pos, self.player)
+            for pos in self.get_symmetries().get_unique_spaces(self.board)
+        ]
+
     def get_score(self, player: Mark=None) -> float:
         if player is None:
             player = self.player
 
-        if self.board.check_if_win_anywhere(player):
+        if self.winner == player:
             return 1.0
-        for other_player in self.get_all_players():
-            if other_player != player and self.board.check_if_win_anywhere(other_player):
-                return 0.0
-        if not self.board.get_available_spaces():
+        if self.winner is not None:
+            return 0.0
+        if self.num_empty == 0:
             return 0.5
         return 0
 
     def is_terminal(self) -> bool:
-        return (
-            not self.board.get_available_spaces()
-            or any([
-                self.board.check_if_win_anywhere(player) 
-                for player in self.get_all_players()
-            ])
-        )
+        return self.winner is not None or self.num_empty == 0
 
 
 class RandomAIAgent:
+    def __init__(self, seed: int=None):
+        self.rng = random.Random(seed)
+
     def get_move(self, state: GameState) -> Action:
-        return random.choice(state.get_actions())
+        return self.rng.choice(state.get_actions())
+
+
+def get_playout_scores(state: GameState, player: Mark, win_rate: float, draw_rate: float) -> Dict[Mark, float]:
+    """
+    Get the scores to back up for a playout (or average of playouts) where
+    ``player`` won and drew at these rates: their expected score for them,
+    and minus their win rate for everyone else.
+    """
+    all_scores = {other_player: -float(win_rate) for other_player in state.get_all_players()}
+    all_scores[player] = float(win_rate + 0.5 * draw_rate)
+    return all_scores
+
+
+def ucb1_score(
+        average_score: float,
+        times_visited: int,
+        log_parent_visits: float,
+        exploration_rate: float,
+        sqrt: Callable[[float], float]=math.sqrt) -> float:
+    """
+    Get a visited child's UCB1 score: its average score plus an exploration
+    bonus that shrinks as it gets more of its parent's visits. Also scores
+    NumPy arrays of children at once, given ``sqrt=np.sqrt``.
+    """
+    return average_score + exploration_rate * sqrt(log_parent_visits / times_visited)
 
 
 class MCTSNode:
@@ -97,13 +216,32 @@ class MCTSNode:
         self.total_score = 0
         self.action = action
         self.children = {}
+        # How many tree-parallel searches are currently descending through
+        # this node; each counts as a lost visit until its result is backed up
+        # so other searches are steered towards different branches
+        self.virtual_losses = 0
+        # The score this node's player is guaranteed with perfect play (1.0 for
+        # a win, 0.5 for a draw, 0.0 for a loss), once the MCTS solver has
+        # proven it
+        self.proven_score = None
+        # All-moves-as-first stats for RAVE: the visits and total score of
+        # playouts through the parent in which this node's action was played
+        # at any point, not just straight away
+        self.amaf_visits = 0
+        self.amaf_score = 0
+        # How many nodes are in the subtree under (and including) this one,
+        # kept up to date as the search expands it
+        self.num_nodes = 1
 
     def utc1_score(self, total_parent_visits: int, exploration_rate: float=2.0) -> float:
-        if self.times_visited == 0:
+        times_visited = self.times_visited + self.virtual_losses
+        if times_visited == 0:
             return float('inf')
-        # TODO: What's a better name for this variable?
-        visited_amount = math.sqrt(math.log(total_parent_visits)/self.times_visited)
-        return self.average_score() + exploration_rate * visited_amount
+        # With a transposition table, a child can already have visits from
+        # another parent before this parent has any
+        total_parent_visits = max(total_parent_visits, 1)
+        return ucb1_score(
+            self.total_score / times_visited, times_visited, math.log(total_parent_visits), exploration_rate)
 
     def average_score(self) -> float:
         if self.times_visited == 0:
@@ -115,37 +253,1028 @@ class MCTSNode:
         if self.action:
             self.total_score += player_scores.get(self.action.player, 0)
 
-    def expand(self, state: GameState):
+    def update_proven_score(self):
+        """
+        Work out this node's proven score from its children's, minimax-style:
+        it's lost if the opponent has a proven winning reply, and otherwise
+        only proven once every reply is.
+        """
+        child_scores = [child.proven_score for child in self.children.values()]
+        if not child_scores:
+            return
+        if 1.0 in child_scores:
+            self.proven_score = 0.0
+        elif None not in child_scores:
+            self.proven_score = 1.0 - max(child_scores)
+
+    def update_amaf(self, later_actions: Set[Action], player_scores: Dict[Mark, float]):
+        """
+        Add a playout's result to the AMAF stats of every child whose action
+        was played at some point after this node
+        """
+        for action, child in self.children.items():
+            if action in later_actions:
+                child.amaf_visits += 1
+                child.amaf_score += player_scores.get(action.player, 0)
+
+    def expand(self, state: GameState, unique_only: bool=False):
         # NOTE: "State" should always be the state assuming we've ALREADY taken
         # this node's action
-        actions = state.get_actions()
+        actions = state.get_unique_actions() if unique_only else state.get_actions()
         self.children = {action: MCTSNode(action) for action in actions}
+        self.num_nodes = 1 + len(self.children)
+
+    def get_best_child(self, exploration_rate: float=2.0, skip_solved: bool=False) -> "MCTSNode":
+        """
+        Get the child with the highest ``utc1_score``. This is the same as
+        scoring each child separately, but only takes the log of this node's
+        visits once and returns the first unvisited child straight away.
+
+        If ``skip_solved`` is set, children with a proven score are ignored
+        (returning None if they all have one).
+        """
+        best_child, best_score = None, -math.inf
+        log_parent_visits = math.log(max(self.times_visited, 1))
+        for child in self.children.values():
+            if skip_solved and child.proven_score is not None:
+                continue
+            times_visited = child.times_visited + child.virtual_losses
+            if times_visited == 0:
+                return child
+            score = ucb1_score(
+                child.total_score / times_visited, times_visited, log_parent_visits, exploration_rate)
+            if score > best_score:
+                best_child, best_score = child, score
+        return best_child
+
+    def get_best_rave_child(
+            self,
+            rave_equivalence: float,
+            exploration_rate: float=2.0,
+            skip_solved: bool=False) -> "MCTSNode":
+        """
+        The same as ``get_best_child()``, but each child's average score is
+        blended with its AMAF average (RAVE). The AMAF average is trusted
+        fully at first and phased out as the child gets visits of its own,
+        with ``rave_equivalence`` visits being roughly where they count
+        equally.
+        """
+        best_child, best_score = None, -math.inf
+        log_parent_visits = math.log(max(self.times_visited, 1))
+        for child in self.children.values():
+            if skip_solved and child.proven_score is not None:
+                continue
+            times_visited = child.times_visited + child.virtual_losses
+            if times_visited == 0 and child.amaf_visits == 0:
+                return child
+            average_score = child.total_score / times_visited if times_visited else 0
+            amaf_score = child.amaf_score / child.amaf_visits if child.amaf_visits else average_score
+            beta = math.sqrt(rave_equivalence / (3 * times_visited + rave_equivalence))
+            score = ucb1_score(
+                (1 - beta) * average_score + beta * amaf_score, max(times_visited, 1),
+                log_parent_visits, exploration_rate)
+            if score > best_score:
+                best_child, best_score = child, score
+        return best_child
+
+
+class TranspositionTable:
+    """
+    A bounded store of MCTS statistics keyed by position hash, so a position
+    reached through different move orders shares one set of visits and scores.
+
+    Each entry is a childless ``MCTSNode`` holding the score of the player who
+    moved into that position. Once the table is full, the least recently used
+    entry is evicted (it just looks unvisited the next time it's reached).
+    """
+    def __init__(self, max_size: int=100_000):
+        self.max_size = max_size
+        self._entries = collections.OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> MCTSNode:
+        node = self._entries.get(key)
+        if node is not None:
+            self._entries.move_to_end(key)
+        return node
+
+    def get_or_create(self, key: Hashable, action: Action) -> MCTSNode:
+        node = self.get(key)
+        if node is None:
+            node = MCTSNode(action)
+            self._entries[key] = node
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return node
+
+    def clear(self):
+        self._entries.clear()
+
+
+# Roughly how much memory each MCTSNode takes up, including its entry in its
+# parent's children and its action (see benchmark.measure_node_memory())
+APPROX_MCTS_NODE_BYTES = 360
+# How many iterations to run between checks of whether the best move is
+# already decided
+EARLY_STOP_CHECK_INTERVAL = 32
+# How many visits of its own a move needs before RAVE weights its AMAF stats
+# and its real average roughly equally
+DEFAULT_RAVE_EQUIVALENCE = 300
+
+
+@dataclasses.dataclass
+class SearchBudget:
+    """
+    Limits on how long a search can run; it stops as soon as any is reached.
+
+    ``time_limit`` is in seconds, and ``max_nodes``/``max_memory_bytes`` limit
+    the size of the search tree. If ``early_stop`` is set, the search also
+    stops once no other move could overtake the best one in the iterations
+    left (estimated from the iteration limit and/or the remaining time).
+
+    ``should_stop`` can also be given to stop the search from outside (e.g.
+    when it's cancelled): it's called after every iteration, so it should be
+    cheap, and the search stops as soon as it returns True.
+    """
+    iterations: int=None
+    time_limit: float=None
+    max_nodes: int=None
+    max_memory_bytes: int=None
+    early_stop: bool=True
+    should_stop: Callable[[], bool]=None
+
+    def __post_init__(self):
+        if all(limit is None for limit in (
+                self.iterations, self.time_limit, self.max_nodes, self.max_memory_bytes)):
+            raise ValueError("A search budget needs at least one limit")
+
+
+class StopReason(enum.Enum):
+    ITERATIONS="iterations"
+    TIME="time"
+    NODES="nodes"
+    MEMORY="memory"
+    # The best move couldn't change in the iterations left
+    DECIDED="decided"
+    # The solver proved the result of the root position
+    SOLVED="solved"
+    # The budget's should_stop() returned True
+    STOPPED="stopped"
+
+
+@dataclasses.dataclass
+class SearchResult:
+    action: Action
+    iterations: int
+    elapsed: float
+    num_nodes: int
+    stop_reason: StopReason
+
+    @property
+    def iterations_per_second(self) -> float:
+        return self.iterations / self.elapsed if self.elapsed > 0 else 0.0
+
+
+@dataclasses.dataclass
+class SearchProfile:
+    """
+    Counters and timers (in seconds) for one search, passed to
+    ``SearchHooks``. The per-phase stats are only collected for the serial
+    ``MCTSNode`` tree search.
+    """
+    iterations: int=0
+    elapsed: float=0.0
+    num_nodes: int=0
+    selection_time: float=0.0
+    expansion_time: float=0.0
+    playout_time: float=0.0
+    backup_time: float=0.0
+    expansions: int=0
+    playouts: int=0
+    # The total moves made by random playouts (ones that aren't batched or
+    # looked up in a tablebase), and how many such playouts there were
+    playout_moves: int=0
+    random_playouts: int=0
+    # The deepest and total depth of the leaves reached by selection
+    max_depth: int=0
+    total_depth: int=0
+
+    @property
+    def average_playout_length(self) -> float:
+        return self.playout_moves / self.random_playouts if self.random_playouts else 0.0
+
+    @property
+    def average_depth(self) -> float:
+        return self.total_depth / self.iterations if self.iterations else 0.0
+
+    @property
+    def nodes_per_second(self) -> float:
+        return self.num_nodes / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def iterations_per_second(self) -> float:
+        return self.iterations / self.elapsed if self.elapsed > 0 else 0.0
+
+    def to_dict(self) -> dict:
+        stats = dataclasses.asdict(self)
+        for name in ("average_playout_length", "average_depth", "nodes_per_second", "iterations_per_second"):
+            stats[name] = getattr(self, name)
+        return stats
+
+
+class _PhaseTimer:
+    """
+    Adds the time spent in each phase of a search iteration to a
+    ``SearchProfile``, where each call to ``start()`` ends the current phase
+    """
+    def __init__(self, profile: SearchProfile):
+        self.profile = profile
+        self._phase = None
+        self._phase_start = 0.0
+
+    def start(self, phase: str):
+        """
+        Start timing the given phase (the name of one of the profile's
+        ``*_time`` fields), or stop timing if it's None
+        """
+        now = time.perf_counter()
+        if self._phase is not None:
+            setattr(self.profile, self._phase, getattr(self.profile, self._phase) + now - self._phase_start)
+        self._phase, self._phase_start = phase, now
+
+
+def _action_to_dict(action: Action) -> dict:
+    return {"pos": list(action.pos.coords), "player": action.player.name}
+
+
+def get_principal_variation(root: MCTSNode, max_length: int=None) -> List[dict]:
+    """
+    Get the line of play the search expects, by following the most visited
+    child from the root, as a list of each move's action and stats.
+    """
+    variation = []
+    node = root
+    while node.children and (max_length is None or len(variation) < max_length):
+        node = max(node.children.values(), key=lambda child: child.times_visited)
+        if node.times_visited == 0:
+            break
+        variation.append({
+            **_action_to_dict(node.action),
+            "visits": node.times_visited,
+            "average_score": node.average_score(),
+        })
+    return variation
+
+
+def get_visit_distribution(root: MCTSNode) -> List[dict]:
+    """
+    Get the share of the search spent on each of the root's moves, from most
+    to least visited.
+    """
+    total_visits = sum(child.times_visited for child in root.children.values())
+    return [
+        {
+            **_action_to_dict(child.action),
+            "visits": child.times_visited,
+            "fraction": child.times_visited / total_visits if total_visits else 0.0,
+            "average_score": child.average_score(),
+            "proven_score": child.proven_score,
+        }
+        for child in sorted(root.children.values(), key=lambda child: -child.times_visited)
+    ]
+
+
+class SearchHooks:
+    """
+    Callbacks for instrumenting an ``MCTSAgent``'s searches (pass one as
+    ``MCTSAgent(hooks=...)``); override whichever are needed. They're called
+    for searches run in this process, not by root-parallel workers.
+    """
+    def on_search_start(self, state: GameState):
+        pass
+
+    def on_iteration(self, root: MCTSNode, profile: SearchProfile):
+        """
+        Called after each iteration of a serial search. The root only has
+        children during the search when using ``MCTSNode`` trees.
+        """
+        pass
+
+    def on_search_end(self, root: MCTSNode, profile: SearchProfile):
+        pass
+
+
+class SearchRecorder(SearchHooks):
+    """
+    Keeps the profile of every search, plus samples of the principal
+    variation and root visit distribution taken every ``sample_interval``
+    iterations (if given) and at the end of each search.
+    """
+    def __init__(self, sample_interval: int=None, max_variation_length: int=None):
+        self.sample_interval = sample_interval
+        self.max_variation_length = max_variation_length
+        self.profiles: List[SearchProfile] = []
+        self.samples: List[dict] = []
+
+    def _sample(self, root: MCTSNode, profile: SearchProfile):
+        self.samples.append({
+            "search": len(self.profiles),
+            "iteration": profile.iterations,
+            "principal_variation": get_principal_variation(root, self.max_variation_length),
+            "visit_distribution": get_visit_distribution(root),
+        })
+
+    def on_iteration(self, root: MCTSNode, profile: SearchProfile):
+        if self.sample_interval and profile.iterations % self.sample_interval == 0:
+            self._sample(root, profile)
+
+    def on_search_end(self, root: MCTSNode, profile: SearchProfile):
+        self._sample(root, profile)
+        self.profiles.append(profile)
+
+
+def count_nodes(root: MCTSNode) -> int:
+    """
+    Count the nodes in a tree by walking it (``MCTSNode.num_nodes`` keeps the
+    same count as a search grows the tree, without the walk)
+    """
+    num_nodes = 0
+    nodes = [root]
+    while nodes:
+        node = nodes.pop()
+        num_nodes += 1
+        nodes.extend(node.children.values())
+    return num_nodes
+
+
+def _get_move_value(child: MCTSNode) -> float:
+    """
+    Get how good a move is for picking the best one, using its proven score if
+    the solver found one (so proven wins always come first and proven losses
+    last), and its average score otherwise
+    """
+    if child.proven_score is None:
+        return child.average_score()
+    if child.proven_score == 1.0:
+        return math.inf
+    if child.proven_score == 0.0:
+        return -math.inf
+    return child.proven_score
 
-    def get_best_child(self) -> "MCTSNode":
-        nodes_w_scores = {node: node.utc1_score(self.times_visited) for node in self.children.values()}
-        return max(nodes_w_scores, key=nodes_w_scores.get)
+
+def _is_decided(children: List[MCTSNode], iterations_left: float) -> bool:
+    """
+    Check whether the child with the best average score would still be best
+    even if every remaining iteration went against it, or in favor of any
+    other child (scores backed up per iteration are between -1 and 1).
+    """
+    if not children or any(child.times_visited == 0 for child in children):
+        return False
+    leader = max(children, key=lambda child: child.average_score())
+    leader_worst = (
+        (leader.total_score - iterations_left)
+        / (leader.times_visited + iterations_left))
+    return all(
+        max(child.average_score(),
+            (child.total_score + iterations_left) / (child.times_visited + iterations_left))
+        < leader_worst
+        for child in children if child is not leader
+    )
 
 
 class MCTSAgent:
     """
     A Monte-Carlo Tree Search implementation that can play tic-tac-toe.
+
+    If ``transposition_table_size`` is given, statistics are kept per position
+    in a ``TranspositionTable`` of that size (shared across moves) instead of
+    per tree node.
+
+    If ``use_symmetries`` is set, only one of each group of moves leading to
+    rotated/reflected positions is searched, and the transposition table (if
+    any) is keyed by canonical position so symmetric positions share stats.
+
+    If ``reuse_tree`` is set, the agent keeps its search tree between calls to
+    ``get_move()``. The next call advances the root through the moves played
+    since then and keeps searching from that subtree instead of starting over
+    (the rest of the old tree is released). Call ``reset()`` between games.
+
+    If ``num_workers`` is more than 1, searches run in parallel according to
+    ``parallel_mode``:
+
+    - ``"root"``: runs that many independent searches (each of ``iterations``,
+      with its own random seed) in a process pool and merges their root
+      statistics before picking a move. Call ``close()`` to shut the pool down
+      when done. This can't be combined with tree reuse, since the workers'
+      trees aren't kept.
+    - ``"tree"``: runs that many threads over one shared tree, for a total of
+      ``iterations``. Selection, expansion and backup are done under a lock
+      and use virtual loss to spread the threads across branches, while the
+      playouts run concurrently. The threads only run in parallel on
+      free-threaded Python builds; with the GIL this is no faster than a
+      single thread. This can't be combined with a transposition table, the
+      solver, RAVE or hooks.
+
+    If ``playout_batch_size`` is given, each leaf is evaluated by that many
+    random playouts run at once with NumPy (see ``batch_playout``) and backed
+    up as their average, trading tree depth for simulation throughput.
+
+    If ``use_array_tree`` is set, the search tree is stored in a compact
+    ``ArrayTree`` instead of ``MCTSNode`` objects (the tree from the last
+    search is kept in ``array_tree`` to check its memory use). This can't be
+    combined with the transposition table, tree reuse or tree parallelism.
+
+    If ``use_solver`` is set, the search proves wins, losses and draws as it
+    reaches terminal positions and propagates them up the tree minimax-style
+    (MCTS-Solver). Solved subtrees aren't searched again, proven moves are
+    preferred over estimated ones, and the search ends as soon as the root is
+    solved. This only applies to ``MCTSNode`` trees, so it can't be combined
+    with the transposition table or array trees (or tree parallelism).
+
+    If ``tablebase_path`` is given, leaves found in that tablebase (see
+    ``tablebase``) are scored with their exact perfect-play result instead of
+    a random playout.
+
+    If ``opening_book_path`` is given, nodes expanded in positions covered by
+    that opening book (see ``opening_book``) start with the book's visits and
+    scores for each move, so the search picks up where earlier searches left
+    off. This only applies to ``MCTSNode`` trees, so it can't be combined with
+    the transposition table or array trees.
+
+    If ``hooks`` are given (e.g. a ``SearchRecorder``), they're called as each
+    search starts, after each iteration and when it ends, with a
+    ``SearchProfile`` of counters and timers for the search.
+
+    If ``rollout_policy`` is given (a ``rollout.RolloutPolicy`` or the name of
+    a built-in one, e.g. ``"win-block"``), playouts pick their moves with it
+    instead of uniformly at random.
+
+    If ``use_rave`` is set, each node also keeps all-moves-as-first (AMAF)
+    stats for its children, crediting every move that was played at any point
+    later in a playout, and selection blends them with the children's own
+    averages (RAVE, see ``MCTSNode.get_best_rave_child()``). Moves get useful
+    estimates after far fewer visits, at the cost of some bias, weighted by
+    ``rave_equivalence``. This only applies to ``MCTSNode`` trees, so it can't
+    be combined with the transposition table or array trees (or tree
+    parallelism).
+
+    Every random choice the agent makes comes from its own generator
+    (``rng``), seeded with ``seed`` if given, so with the same seed (and
+    options) a search builds the same tree and picks the same move. Call
+    ``seed()`` to reseed it, e.g. before each search. Root-parallel workers and
+    batched playouts are seeded from it too, and so are the threads of a
+    tree-parallel search, though the way those interleave still isn't
+    reproducible.
     """
+    def __init__(
+            self,
+            transposition_table_size: int=None,
+            use_symmetries: bool=False,
+            reuse_tree: bool=False,
+            num_workers: int=1,
+            parallel_mode: str="root",
+            playout_batch_size: int=None,
+            use_array_tree: bool=False,
+            use_solver: bool=False,
+            tablebase_path: str=None,
+            opening_book_path: str=None,
+            hooks: SearchHooks=None,
+            rollout_policy=None,
+            use_rave: bool=False,
+            rave_equivalence: float=DEFAULT_RAVE_EQUIVALENCE,
+            seed: int=None):
+        if parallel_mode not in ("root", "tree"):
+            raise ValueError(f"Unknown parallel mode: {parallel_mode}")
+        if parallel_mode == "root" and num_workers > 1 and reuse_tree:
+            raise ValueError("Root-parallel search can't reuse the tree")
+        if parallel_mode == "tree" and num_workers > 1 and (
+                transposition_table_size or use_solver or use_rave or hooks):
+            raise ValueError(
+                "Tree-parallel search doesn't support a transposition table, the solver, RAVE or hooks")
+        if use_array_tree and (
+                transposition_table_size or reuse_tree
+                or (parallel_mode == "tree" and num_workers > 1)):
+            raise ValueError(
+                "Array trees can't be used with a transposition table, tree reuse or tree parallelism")
+        if use_solver and (transposition_table_size or use_array_tree):
+            raise ValueError("The solver can't be used with a transposition table or array tree")
+        if use_rave and (transposition_table_size or use_array_tree):
+            raise ValueError("RAVE can't be used with a transposition table or array tree")
+        if opening_book_path and (transposition_table_size or use_array_tree):
+            raise ValueError("Opening books can't be used with a transposition table or array tree")
+        if playout_batch_size and rollout_policy:
+            raise ValueError("Batched playouts can't use a rollout policy")
+        self.transposition_table_size = transposition_table_size
+        self.use_symmetries = use_symmetries
+        self.reuse_tree = reuse_tree
+        self.num_workers = num_workers
+        self.parallel_mode = parallel_mode
+        self.playout_batch_size = playout_batch_size
+        self.use_array_tree = use_array_tree
+        self.array_tree = None
+        self.use_solver = use_solver
+        self._batch_playouts = None
+        if playout_batch_size:
+            # Only needed (along with NumPy) if batched playouts are used
+            from batch_playout import BatchPlayouts
+            self._batch_playouts = BatchPlayouts(playout_batch_size)
+        self.tablebase_path = tablebase_path
+        self._tablebase = None
+        if tablebase_path:
+            from tablebase import Tablebase
+            self._tablebase = Tablebase(tablebase_path)
+        self.opening_book_path = opening_book_path
+        self._opening_book = None
+        if opening_book_path:
+            from opening_book import OpeningBook
+            self._opening_book = OpeningBook(opening_book_path)
+        self.hooks = hooks
+        self.rollout_policy = None
+        if rollout_policy:
+            from rollout import get_rollout_policy
+            self.rollout_policy = get_rollout_policy(rollout_policy)
+        self.use_rave = use_rave
+        self.rave_equivalence = rave_equivalence
+        self.seed(seed)
+        self._executor = None
+        self.transposition_table = None
+        if transposition_table_size:
+            self.transposition_table = TranspositionTable(transposition_table_size)
+        # The tree from the last search and the state it was searched from
+        # (only kept if reuse_tree is set)
+        self.root = None
+        self._root_state = None
+
+    def reset(self):
+        """
+        Forget everything learned from previous searches.
+        """
+        self.root = None
+        self._root_state = None
+        if self.transposition_table is not None:
+            self.transposition_table.clear()
+
+    def seed(self, seed: int=None):
+        """
+        Reseed the agent's random number generator (randomly if no seed is
+        given)
+        """
+        self.rng = random.Random(seed)
+        if self._batch_playouts is not None:
+            self._batch_playouts.seed(self.rng.getrandbits(64))
+
+    def close(self):
+        """
+        Shut down the worker processes used for parallel searches, if any, and
+        close the tablebase and opening book.
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        if self._tablebase is not None:
+            self._tablebase.close()
+        if self._opening_book is not None:
+            self._opening_book.close()
+
+    def __enter__(self) -> "MCTSAgent":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
     def get_move(self, state: GameState, iterations: int=1000, verbose: bool=False) -> Point:
         """
         Returns the move to play given the current board state.
         """
+        root = self.search(state, iterations)
+        return self.get_best_move(root, verbose)
+
+    def get_move_with_budget(self, state: GameState, budget: SearchBudget, verbose: bool=False) -> SearchResult:
+        """
+        Searches until the budget runs out (or the best move is decided) and
+        returns the move to play along with stats on how the search went.
+
+        Parallel searches only support iteration budgets, and always run all
+        of their iterations (``early_stop`` is ignored).
+        """
+        if self.num_workers > 1 and (
+                (budget.time_limit, budget.max_nodes, budget.max_memory_bytes, budget.should_stop)
+                != (None, None, None, None)):
+            raise ValueError("Parallel searches only support iteration budgets")
+        if self.num_workers > 1 and self.parallel_mode == "root":
+            start = time.perf_counter()
+            root = self._search_root_parallel(state, budget.iterations)
+            result = SearchResult(
+                action=None,
+                iterations=budget.iterations * self.num_workers,
+                elapsed=time.perf_counter() - start,
+                num_nodes=count_nodes(root),
+                stop_reason=StopReason.ITERATIONS,
+            )
+        else:
+            root, result = self._search(state, budget)
+        result.action = self.get_best_move(root, verbose)
+        return result
+
+    def search(self, state: GameState, iterations: int=1000) -> MCTSNode:
+        """
+        Runs the given number of MCTS iterations from the given state and
+        returns the root of the search tree.
+        """
+        if self.num_workers > 1 and self.parallel_mode == "root":
+            return self._search_root_parallel(state, iterations)
+        root, _ = self._search(state, SearchBudget(iterations=iterations, early_stop=False))
+        return root
+
+    def _search(self, state: GameState, budget: SearchBudget) -> Tuple[MCTSNode, SearchResult]:
+        """
+        Runs MCTS iterations from the given state until the budget runs out and
+        returns the root of the search tree along with stats on the search (not
+        including the chosen move).
+        """
+        start = time.perf_counter()
+        # The search makes and takes back moves on its own copy of the state,
+        # so it never allocates a new board per step
+        state = state.copy()
         root = MCTSNode()
-        root.expand(state)
-        for i in range(iterations):
-            score = self.mcts(root, state)
-            root.update(score)
-        return self._get_best_move(root, verbose)
+        profile = None
+        if self.hooks is not None:
+            profile = SearchProfile()
+            self.hooks.on_search_start(state)
+        if self.transposition_table is not None:
+            def run_iteration():
+                root.update(self.mcts_transposition(root, state))
+            def get_root_children() -> Dict[Action, MCTSNode]:
+                return self._get_transposition_children(self._get_child_keys(state))
+            count_nodes = self.transposition_table.__len__
+            bytes_per_node = APPROX_MCTS_NODE_BYTES
+            is_solved = lambda: False
+        elif self.use_array_tree:
+            # Only imported (along with NumPy, if installed) for array trees
+            from array_tree import ROOT, ArrayTree
+            tree = ArrayTree()
+            self.array_tree = tree
+            self._expand_array_node(tree, ROOT, state)
+            def run_iteration():
+                self.mcts_array(tree, state)
+                # Back the root up again, as the other searches do
+                tree.update(ROOT, 0)
+            def get_root_children() -> Dict[Action, MCTSNode]:
+                return self._get_array_root_children(tree, state)
+            count_nodes = lambda: tree.num_nodes
+            bytes_per_node = tree.bytes_per_node
+            is_solved = lambda: False
+        else:
+            if self.reuse_tree:
+                root = self._advance_root(state) or root
+            if not root.children:
+                self._expand(root, state)
+            timer = _PhaseTimer(profile) if profile is not None else None
+            def run_iteration():
+                if timer is not None:
+                    timer.start("selection_time")
+                root.update(self.mcts(root, state, [] if self.use_rave else None, timer))
+                if timer is not None:
+                    timer.start(None)
+            get_root_children = lambda: root.children
+            count_nodes = lambda: root.num_nodes
+            bytes_per_node = APPROX_MCTS_NODE_BYTES
+            is_solved = lambda: root.proven_score is not None
+
+        if profile is not None:
+            # Only wrapped when instrumenting, so uninstrumented searches
+            # don't pay for the hooks at all
+            run_search_iteration = run_iteration
+            def run_iteration():
+                run_search_iteration()
+                profile.iterations += 1
+                self.hooks.on_iteration(root, profile)
+
+        if self.num_workers > 1 and self.parallel_mode == "tree":
+            self._search_tree_parallel(root, state, budget.iterations)
+            iterations, stop_reason = budget.iterations, StopReason.ITERATIONS
+        else:
+            iterations, stop_reason = self._run_iterations(
+                budget, start, run_iteration, get_root_children, count_nodes, bytes_per_node, is_solved)
+        if self.transposition_table is not None:
+            root.children = get_root_children()
+        elif self.use_array_tree:
+            root.times_visited = tree.times_visited[ROOT]
+            root.children = get_root_children()
+        elif self.reuse_tree:
+            self.root, self._root_state = root, state
+        result = SearchResult(
+            None, iterations, time.perf_counter() - start, count_nodes(), stop_reason)
+        self._end_profile(root, profile, result)
+        return root, result
 
-    def mcts(self, node: MCTSNode, state: GameState) -> Dict[Mark, float]:
+    def _end_profile(self, root: MCTSNode, profile: SearchProfile, result: SearchResult):
+        if profile is None:
+            return
+        profile.iterations = result.iterations
+        profile.elapsed = result.elapsed
+        profile.num_nodes = result.num_nodes
+        self.hooks.on_search_end(root, profile)
+
+    def _run_iterations(
+            self,
+            budget: SearchBudget,
+            start: float,
+            run_iteration: Callable[[], None],
+            get_root_children: Callable[[], Dict[Action, MCTSNode]],
+            count_nodes: Callable[[], int],
+            bytes_per_node: int,
+            is_solved: Callable[[], bool]) -> Tuple[int, StopReason]:
+        """
+        Runs search iterations until the budget runs out (always running at
+        least one unless the root is already solved) and returns how many were
+        run and why it stopped. The time limit counts from ``start``, so it
+        includes the search's setup.
+        """
+        iterations = 0
+        while True:
+            if is_solved():
+                return iterations, StopReason.SOLVED
+            run_iteration()
+            iterations += 1
+            elapsed = time.perf_counter() - start
+
+            if budget.iterations is not None and iterations >= budget.iterations:
+                return iterations, StopReason.ITERATIONS
+            if budget.time_limit is not None and elapsed >= budget.time_limit:
+                return iterations, StopReason.TIME
+            if budget.max_nodes is not None and count_nodes() >= budget.max_nodes:
+                return iterations, StopReason.NODES
+            if (budget.max_memory_bytes is not None
+                    and count_nodes() * bytes_per_node >= budget.max_memory_bytes):
+                return iterations, StopReason.MEMORY
+            if budget.should_stop is not None and budget.should_stop():
+                return iterations, StopReason.STOPPED
+
+            if budget.early_stop and iterations % EARLY_STOP_CHECK_INTERVAL == 0:
+                iterations_left = math.inf
+                if budget.iterations is not None:
+                    iterations_left = budget.iterations - iterations
+                if budget.time_limit is not None:
+                    iterations_left = min(
+                        iterations_left,
+                        iterations / elapsed * (budget.time_limit - elapsed))
+                if iterations_left < math.inf and _is_decided(
+                        list(get_root_children().values()), iterations_left):
+                    return iterations, StopReason.DECIDED
+
+    def _get_array_root_children(self, tree: "ArrayTree", state: GameState) -> Dict[Action, MCTSNode]:
+        """
+        Get ``MCTSNode`` copies of the statistics of an ``ArrayTree``'s
+        top-level moves
+        """
+        from array_tree import ROOT
+        cell_points = get_cell_points(state.board.board_size, state.board.num_dimensions)
+        children = {}
+        for child in tree.get_children(ROOT):
+            action = Action(cell_points[tree.action_cells[child]], state.player)
+            children[action] = MCTSNode(action)
+            children[action].times_visited = tree.times_visited[child]
+            children[action].total_score = tree.total_scores[child]
+        return children
+
+    def mcts_array(self, tree: "ArrayTree", state: GameState) -> Dict[Mark, float]:
+        """
+        The same as ``mcts()`` (starting from the root), but on an
+        ``ArrayTree``. Since array nodes don't store their action's player,
+        the players are tracked along the path as moves are made.
+        """
+        from array_tree import ROOT
+        board = state.board
+        cell_points = get_cell_points(board.board_size, board.num_dimensions)
+        path = [ROOT]
+        movers = [None]
+        node = ROOT
+        while tree.child_count[node] or tree.times_visited[node] > 0:
+            if not tree.child_count[node]:
+                self._expand_array_node(tree, node, state)
+                # Handle edge case where the expanded node still has no children
+                if not tree.child_count[node]:
+                    break
+            node = tree.get_best_child(node)
+            movers.append(state.player)
+            state.apply_action(Action(cell_points[tree.action_cells[node]], state.player))
+            path.append(node)
+
+        player_scores = self.playout(state, movers[-1] or state.player)
+        for _ in range(len(path) - 1):
+            state.undo_action()
+        for node, mover in zip(path, movers):
+            tree.update(node, player_scores.get(mover, 0))
+        return player_scores
+
+    def _expand_array_node(self, tree: "ArrayTree", node: int, state: GameState):
+        board = state.board
+        actions = state.get_unique_actions() if self.use_symmetries else state.get_actions()
+        tree.expand(node, [
+            get_cell_index(action.pos, board.board_size, board.num_dimensions)
+            for action in actions
+        ])
+
+    def _search_tree_parallel(self, root: MCTSNode, state: GameState, iterations: int):
+        """
+        Runs the given number of iterations on the shared tree under the root,
+        split between ``num_workers`` threads.
+        """
+        lock = threading.Lock()
+        iterations_left = [iterations]
+
+        def run_worker(seed: int):
+            # Each thread makes and takes back moves on its own state, with
+            # its own random number generator
+            worker_state = state.copy()
+            rng = random.Random(seed)
+            while True:
+                with lock:
+                    if iterations_left[0] <= 0:
+                        return
+                    iterations_left[0] -= 1
+                score = self.mcts_tree_parallel(root, worker_state, lock, rng, [])
+                with lock:
+                    root.update(score)
+
+        threads = [
+            threading.Thread(target=run_worker, args=(self.rng.getrandbits(64),))
+            for _ in range(self.num_workers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def mcts_tree_parallel(
+            self,
+            node: MCTSNode,
+            state: GameState,
+            lock: threading.Lock,
+            rng: random.Random,
+            ancestors: List[MCTSNode]) -> Dict[Mark, float]:
+        """
+        The same as ``mcts()``, but safe to run from several threads at once on
+        the same tree. The tree is only read or changed while holding the lock,
+        and a virtual loss is added to each chosen child until its result is
+        backed up. ``ancestors`` are the nodes above this one, whose node
+        counts grow when it's expanded.
+        """
+        best_child = None
+        with lock:
+            if node.children or node.times_visited > 0:
+                if not node.children:
+                    self._expand(node, state)
+                    for ancestor in ancestors:
+                        ancestor.num_nodes += len(node.children)
+                if node.children:
+                    best_child = node.get_best_child()
+                    best_child.virtual_losses += 1
+
+        if best_child is not None:
+            ancestors.append(node)
+            state.apply_action(best_child.action)
+            try:
+                player_scores = self.mcts_tree_parallel(best_child, state, lock, rng, ancestors)
+            finally:
+                state.undo_action()
+                ancestors.pop()
+        else:
+            player_scores = self.playout(state, node.action.player, rng=rng)
+
+        with lock:
+            if best_child is not None:
+                best_child.virtual_losses -= 1
+            node.update(player_scores)
+        return player_scores
+
+    def _search_root_parallel(self, state: GameState, iterations: int) -> MCTSNode:
+        """
+        Runs an independent search in each worker process and returns a root
+        whose children hold the combined visits and scores of every search.
+        """
+        if self._executor is None:
+            self._executor = concurrent.futures.ProcessPoolExecutor(self.num_workers)
+        worker_options = {
+            "transposition_table_size": self.transposition_table_size,
+            "use_symmetries": self.use_symmetries,
+            "playout_batch_size": self.playout_batch_size,
+            "use_array_tree": self.use_array_tree,
+            "use_solver": self.use_solver,
+            "tablebase_path": self.tablebase_path,
+            "opening_book_path": self.opening_book_path,
+            "rollout_policy": self.rollout_policy,
+            "use_rave": self.use_rave,
+            "rave_equivalence": self.rave_equivalence,
+        }
+        seeds = [self.rng.getrandbits(64) for _ in range(self.num_workers)]
+        futures = [
+            self._executor.submit(_run_root_search, worker_options, state, iterations, seed)
+            for seed in seeds
+        ]
+        root = MCTSNode()
+        for future in futures:
+            for action, (times_visited, total_score, proven_score) in future.result().items():
+                child = root.children.setdefault(action, MCTSNode(action))
+                child.times_visited += times_visited
+                child.total_score += total_score
+                root.times_visited += times_visited
+                # Proofs are exact, so any worker's proof holds for all of them
+                if proven_score is not None:
+                    child.proven_score = proven_score
+        if self._opening_book is not None:
+            # Every worker started its root's children from the book's stats,
+            # so only count them once
+            priors = self._opening_book.get_priors(state, root.children)
+            for action, (times_visited, total_score) in priors.items():
+                root.children[action].times_visited -= (self.num_workers - 1) * times_visited
+                root.children[action].total_score -= (self.num_workers - 1) * total_score
+                root.times_visited -= (self.num_workers - 1) * times_visited
+        return root
+
+    def _advance_root(self, state: GameState) -> MCTSNode:
+        """
+        Get the node of the kept tree for the given state by following the
+        moves played since the last search, or None if it can't be reached
+        (e.g. a different game, or a move pruned as symmetric wasn't searched).
+        """
+        if self.root is None:
+            return None
+        old_board, board = self._root_state.board, state.board
+        if (old_board.board_size, old_board.num_dimensions, old_board.win_length) != (
+                board.board_size, board.num_dimensions, board.win_length):
+            return None
+
+        played = {}
+        for pos in old_board.get_available_spaces():
+            mark = board.get_mark(pos)
+            if mark != Mark.BLANK:
+                played[pos] = mark
+        if len(played) != state.move_count - self._root_state.move_count:
+            # Some marks from the old position were changed or removed
+            return None
+
+        node, player = self.root, self._root_state.player
+        while played:
+            # If a player made several moves, any order reaches the same
+            # position, so follow whichever was searched the most
+            candidates = [
+                node.children[Action(pos, player)]
+                for pos, mark in played.items()
+                if mark == player and Action(pos, player) in node.children
+            ]
+            if not candidates:
+                return None
+            node = max(candidates, key=lambda child: child.times_visited)
+            del played[node.action.pos]
+            player = state.get_next_player(player)
+        if player != state.player:
+            return None
+        return node
+
+    def _expand(self, node: MCTSNode, state: GameState):
+        """
+        Add the node's children, starting them off with their stats from the
+        opening book (if any)
+        """
+        node.expand(state, self.use_symmetries)
+        if self._opening_book is not None:
+            priors = self._opening_book.get_priors(state, node.children)
+            for action, (times_visited, total_score) in priors.items():
+                child = node.children[action]
+                child.times_visited += times_visited
+                child.total_score += total_score
+            # A node inside the book already has its own visits from it, which
+            # include its children's, but the root doesn't
+            node.times_visited = max(
+                node.times_visited,
+                sum(child.times_visited for child in node.children.values()))
+
+    def _select_child(self, node: MCTSNode) -> MCTSNode:
+        if self.use_rave:
+            return node.get_best_rave_child(self.rave_equivalence, skip_solved=self.use_solver)
+        return node.get_best_child(skip_solved=self.use_solver)
+
+    def mcts(
+            self,
+            node: MCTSNode,
+            state: GameState,
+            trace: List[Action]=None,
+            timer: "_PhaseTimer"=None) -> Dict[Mark, float]:
         """
         Evaluates a stochastically-chosen game's outcome and returns its outcome
         for the current player, updating the search subtree contained within the
         given node along the way.
+
+        If a ``trace`` list is given (for RAVE), the moves made below the node
+        are added to it and used to update the AMAF stats on the way back up.
+
+        If a ``timer`` is given, the time spent in each phase of the iteration
+        (which should already be timing selection) is added to its profile,
+        along with the expansion, playout and depth counts.
         """
         # NOTE: "State" should always be the state assuming we've ALREADY taken
         # the given node's action
@@ -154,42 +1283,194 @@ class MCTSAgent:
         # evaluating a node happens "before"/"after" the action takes place?)
         if node.children or node.times_visited > 0:
             if not node.children:
-                node.expand(state)
+                if timer is not None:
+                    timer.start("expansion_time")
+                    timer.profile.expansions += 1
+                self._expand(node, state)
+                if timer is not None:
+                    timer.start("selection_time")
             # Handle edge case where the expanded node still has no children
             if node.children:
-                best_child = node.get_best_child()
-                player_scores = self.mcts(
-                    best_child, state.get_next_state(best_child.action))
+                best_child = self._select_child(node)
+                child_num_nodes = best_child.num_nodes
+                state.apply_action(best_child.action)
+                try:
+                    player_scores = self.mcts(best_child, state, trace, timer)
+                finally:
+                    state.undo_action()
+                node.num_nodes += best_child.num_nodes - child_num_nodes
+                if trace is not None:
+                    trace.append(best_child.action)
+                    node.update_amaf(set(trace), player_scores)
+                if self.use_solver:
+                    node.update_proven_score()
             else:
-                player_scores = self.playout(state, node.action.player)
+                player_scores = self._leaf_playout(state, node.action.player, trace, timer)
         else:
-            player_scores = self.playout(state, node.action.player)
+            player_scores = self._leaf_playout(state, node.action.player, trace, timer)
+        if self.use_solver and node.action and state.is_terminal():
+            node.proven_score = state.get_score(node.action.player)
         node.update(player_scores)
         return player_scores
 
-    def playout(self, state: GameState, player: Mark) -> Dict[Mark, float]:
-        current_state = state
-        while not current_state.is_terminal():
-            random_action = random.choice(current_state.get_actions())
-            current_state = current_state.get_next_state(random_action)
-        # Get the score for the original player (not the one who won)
-        player_score = current_state.get_score(player)
-        # If the player won, count that against all other players
-        all_scores = {}
-        if player_score == 1.0:
-            all_scores = {other_player: -1.0 for other_player in state.get_all_players()}
-        all_scores[player] = player_score
-        return all_scores
-
-    def _get_best_move(self, root: MCTSNode, verbose: bool=False) -> Action:
+    def _leaf_playout(
+            self,
+            state: GameState,
+            player: Mark,
+            trace: List[Action],
+            timer: "_PhaseTimer") -> Dict[Mark, float]:
+        """
+        Play out from the leaf ``mcts()`` selected, timing and counting it if
+        there's a timer (after which the timer moves on to the backup phase)
+        """
+        if timer is None:
+            return self.playout(state, player, trace)
+        timer.start("playout_time")
+        player_scores, num_moves = self._playout(state, player, trace)
+        timer.start("backup_time")
+        profile = timer.profile
+        profile.playouts += 1
+        if num_moves is not None:
+            profile.playout_moves += num_moves
+            profile.random_playouts += 1
+        # The search's state starts with no history, so this is the leaf's depth
+        depth = len(state._history)
+        profile.max_depth = max(profile.max_depth, depth)
+        profile.total_depth += depth
+        return player_scores
+
+    def mcts_transposition(self, node: MCTSNode, state: GameState) -> Dict[Mark, float]:
+        """
+        The same as ``mcts()``, but looks up each child's statistics in the
+        transposition table by position instead of storing them in the node.
+        """
+        # The root (the only node without an action) is always expanded
+        is_expanded = node.times_visited > 0 or node.action is None
+        if is_expanded and not state.is_terminal():
+            child_keys = self._get_child_keys(state)
+            children = self._get_transposition_children(child_keys)
+            best_action = max(
+                children, key=lambda action: children[action].utc1_score(node.times_visited))
+            best_child = self.transposition_table.get_or_create(
+                child_keys[best_action], best_action)
+            state.apply_action(best_action)
+            try:
+                player_scores = self.mcts_transposition(best_child, state)
+            finally:
+                state.undo_action()
+        else:
+            player = node.action.player if node.action else state.player
+            player_scores = self.playout(state, player)
+        node.update(player_scores)
+        return player_scores
+
+    def _get_child_keys(self, state: GameState) -> Dict[Action, Hashable]:
+        """
+        Get the transposition table key of the position after each action
+        """
+        if not self.use_symmetries:
+            return {action: state.get_hash_after(action) for action in state.get_actions()}
+        symmetries = state.get_symmetries()
+        symmetric_hashes = symmetries.get_symmetric_hashes(state.board)
+        return {
+            action: (
+                symmetries.get_canonical_hash_with_mark(symmetric_hashes, action.pos, action.player),
+                state.get_next_player(action.player)
+            )
+            for action in state.get_unique_actions()
+        }
+
+    def _get_transposition_children(self, child_keys: Dict[Action, Hashable]) -> Dict[Action, MCTSNode]:
+        # Children that aren't in the table yet count as unvisited
+        children = {}
+        for action, key in child_keys.items():
+            child = self.transposition_table.get(key)
+            children[action] = child if child is not None else MCTSNode(action)
+        return children
+
+    def playout(
+            self,
+            state: GameState,
+            player: Mark,
+            trace: List[Action]=None,
+            rng: random.Random=None) -> Dict[Mark, float]:
+        """
+        Plays random moves until the game ends and returns each player's
+        score (see ``get_playout_scores()``). The moves are made on the given
+        state and taken back afterwards, so it's left unchanged.
+
+        If a ``trace`` list is given, the moves made are added to it (batched
+        and tablebase playouts don't make any). The moves are drawn from
+        ``rng`` if given, and otherwise the agent's own generator.
+        """
+        return self._playout(state, player, trace, rng)[0]
+
+    def _playout(
+            self,
+            state: GameState,
+            player: Mark,
+            trace: List[Action]=None,
+            rng: random.Random=None) -> Tuple[Dict[Mark, float], int]:
+        """
+        The same as ``playout()``, but also returns how many random moves were
+        made (or None if the playout was batched or looked up)
+        """
+        if self._tablebase is not None:
+            player_scores = self._tablebase.get_scores(state, player)
+            if player_scores is not None:
+                return player_scores, None
+        if self._batch_playouts is not None:
+            return self._batch_playouts.playout(state, player), None
+        if rng is None:
+            rng = self.rng
+        if self.rollout_policy is not None:
+            return self.rollout_policy.playout(state, player, trace, rng)
+        choice = rng.choice
+        num_moves = 0
+        while not state.is_terminal():
+            action = choice(state.get_actions())
+            state.apply_action(action)
+            if trace is not None:
+                trace.append(action)
+            num_moves += 1
+        # Score it for the original player (not the one who won)
+        all_scores = get_playout_scores(
+            state, player, float(state.winner == player), float(state.winner is None))
+        for _ in range(num_moves):
+            state.undo_action()
+        return all_scores, num_moves
+
+    def get_best_move(self, root: MCTSNode, verbose: bool=False) -> Action:
+        """
+        Pick the move to play from a searched tree's root (e.g. one returned by
+        ``search()``): a proven win if there is one, and otherwise the move
+        with the best average score, avoiding proven losses.
+        """
         # NOTE: Should still work, since the child of the root node should still
         # all be counting the scores for the initial player
-        actions_w_avg_score = {action: child.average_score() for action, child in root.children.items()}
+        actions_w_avg_score = {action: _get_move_value(child) for action, child in root.children.items()}
         if verbose:
             print(f"CONSIDERED ACTIONS:")
             for action, child in root.children.items():
-                print(f"{action}: {child.average_score()}")
+                print(f"{action}: {child.average_score()} (proven: {child.proven_score})")
                 child_opposing_moves = {action2: child2.average_score() for action2, child2 in child.children.items()}
                 print(f"\tOpposing moves: {child_opposing_moves}")
                 print(f"\tBest Opposing move Children: {child.children}")
         return max(actions_w_avg_score, key=actions_w_avg_score.get)
+
+
+def _run_root_search(
+        agent_options: dict,
+        state: GameState,
+        iterations: int,
+        seed: int) -> Dict[Action, tuple]:
+    """
+    Runs one worker's search for a root-parallel ``MCTSAgent`` and returns the
+    (visits, total score, proven score) of each root child.
+    """
+    with MCTSAgent(seed=seed, **agent_options) as agent:
+        root = agent.search(state, iterations)
+    return {
+        action: (child.times_visited, child.total_score, child.proven_score)
+        for action, child in root.children.items()
+    }
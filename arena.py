@@ -0,0 +1,296 @@
+"""
+Plays many games between two agents without any input, to measure how
+changes to an agent affect its strength.
+
+Usage:
+
+    python arena.py mcts:iterations=1000 mcts:iterations=200,use_solver=true --games 1000 --workers 4
+
+Each player is an agent type (``mcts`` or ``random``) optionally followed by
+``MCTSAgent`` options, plus ``iterations`` per move. The players swap sides
+every game, and each game is seeded so runs can be repeated. Results are
+printed as games finish.
+"""
+import argparse
+import concurrent.futures
+import dataclasses
+import math
+import random
+import time
+from typing import Dict, Iterator, List, Tuple
+
+from agents import GameState, MCTSAgent, RandomAIAgent, SearchBudget
+from game import BitBoard, Mark
+
+
+AGENT_TYPES = {
+    "mcts": MCTSAgent,
+    "random": RandomAIAgent,
+}
+
+
+@dataclasses.dataclass(frozen=True)
+class PlayerConfig:
+    """
+    How to create a player's agent for each game. ``options`` are passed to
+    the agent type's constructor, and ``iterations`` is the search budget per
+    move for MCTS agents.
+    """
+    name: str
+    agent_type: type=MCTSAgent
+    options: Tuple[Tuple[str, object], ...]=()
+    iterations: int=1000
+
+    def create_agent(self, seed: int=None):
+        return self.agent_type(seed=seed, **dict(self.options))
+
+
+def _parse_option_value(value: str) -> object:
+    if value.lower() in ("true", "false"):
+        return value.lower() == "true"
+    for convert in (int, float):
+        try:
+            return convert(value)
+        except ValueError:
+            pass
+    return value
+
+
+def parse_player(spec: str, name: str=None) -> PlayerConfig:
+    """
+    Parse a player from a string like ``mcts:iterations=500,use_solver=true``
+    """
+    agent_name, _, option_str = spec.partition(":")
+    if agent_name not in AGENT_TYPES:
+        raise ValueError(f"Unknown agent type: {agent_name}")
+    options = {}
+    for option in filter(None, option_str.split(",")):
+        key, _, value = option.partition("=")
+        options[key] = _parse_option_value(value)
+    iterations = options.pop("iterations", 1000)
+    return PlayerConfig(
+        name or spec, AGENT_TYPES[agent_name], tuple(sorted(options.items())), iterations)
+
+
+@dataclasses.dataclass
+class GameResult:
+    game_index: int
+    seed: int
+    # The names of the players that played X and O
+    x_player: str
+    o_player: str
+    # The name of the winner, or None for a draw
+    winner: str
+    # How long each of a player's moves took, in seconds
+    move_times: Dict[str, List[float]]
+    # The total MCTS iterations each player ran
+    iterations: Dict[str, int]
+
+
+def play_game(
+        x_player: PlayerConfig,
+        o_player: PlayerConfig,
+        seed: int,
+        game_index: int=0,
+        board_size: int=3,
+        num_dimensions: int=2,
+        win_length: int=None) -> GameResult:
+    """
+    Play one game between freshly-created agents, seeded so the same seed
+    plays the same game.
+    """
+    rng = random.Random(seed)
+    players = {Mark.X: x_player, Mark.O: o_player}
+    agents = {mark: player.create_agent(rng.getrandbits(64)) for mark, player in players.items()}
+    move_times = {player.name: [] for player in players.values()}
+    iterations = {player.name: 0 for player in players.values()}
+    state = GameState(BitBoard(board_size, num_dimensions, win_length), Mark.X)
+    try:
+        while not state.is_terminal():
+            player, agent = players[state.player], agents[state.player]
+            start = time.perf_counter()
+            if isinstance(agent, MCTSAgent):
+                result = agent.get_move_with_budget(
+                    state, SearchBudget(iterations=player.iterations, early_stop=False))
+                action = result.action
+                iterations[player.name] += result.iterations
+            else:
+                action = agent.get_move(state)
+            move_times[player.name].append(time.perf_counter() - start)
+            state.apply_action(action)
+    finally:
+        for agent in agents.values():
+            if isinstance(agent, MCTSAgent):
+                agent.close()
+    return GameResult(
+        game_index=game_index,
+        seed=seed,
+        x_player=x_player.name,
+        o_player=o_player.name,
+        winner=players[state.winner].name if state.winner else None,
+        move_times=move_times,
+        iterations=iterations,
+    )
+
+
+def wilson_interval(successes: int, trials: int, z: float=1.96) -> Tuple[float, float]:
+    """
+    Get the Wilson score confidence interval (95% by default) of a rate
+    """
+    if trials == 0:
+        return 0.0, 1.0
+    rate = successes / trials
+    denominator = 1 + z * z / trials
+    center = (rate + z * z / (2 * trials)) / denominator
+    margin = z * math.sqrt(rate * (1 - rate) / trials + z * z / (4 * trials * trials)) / denominator
+    return max(0.0, center - margin), min(1.0, center + margin)
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """
+    Get the nearest-rank percentile (e.g. 0.5 for the median) of the values
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(fraction * len(ordered)))
+    return ordered[rank - 1]
+
+
+class ArenaStats:
+    """
+    Running win/draw/loss counts (from the first player's point of view) and
+    search speed stats for each player, updated as games finish.
+    """
+    def __init__(self, first_player: str, second_player: str):
+        self.first_player = first_player
+        self.second_player = second_player
+        self.wins = 0
+        self.draws = 0
+        self.losses = 0
+        self.move_times = {first_player: [], second_player: []}
+        self.iterations = {first_player: 0, second_player: 0}
+
+    @property
+    def num_games(self) -> int:
+        return self.wins + self.draws + self.losses
+
+    def add(self, result: GameResult):
+        if result.winner is None:
+            self.draws += 1
+        elif result.winner == self.first_player:
+            self.wins += 1
+        else:
+            self.losses += 1
+        for name in self.move_times:
+            self.move_times[name].extend(result.move_times[name])
+            self.iterations[name] += result.iterations[name]
+
+    def score(self) -> Tuple[float, float]:
+        """
+        Get the first player's average score (1 per win and 0.5 per draw) and
+        the margin of its 95% confidence interval
+        """
+        if self.num_games == 0:
+            return 0.0, 0.0
+        mean = (self.wins + 0.5 * self.draws) / self.num_games
+        variance = (
+            self.wins * (1 - mean) ** 2
+            + self.draws * (0.5 - mean) ** 2
+            + self.losses * mean ** 2
+        ) / self.num_games
+        return mean, 1.96 * math.sqrt(variance / self.num_games)
+
+    def iterations_per_second(self, name: str) -> float:
+        total_time = sum(self.move_times[name])
+        return self.iterations[name] / total_time if total_time > 0 else 0.0
+
+    def summary(self) -> str:
+        lines = [f"{self.num_games} games: {self.first_player} vs {self.second_player}"]
+        for label, count in [("wins", self.wins), ("draws", self.draws), ("losses", self.losses)]:
+            low, high = wilson_interval(count, self.num_games)
+            lines.append(
+                f"  {label:>6}: {count:6d} ({count / max(self.num_games, 1):6.1%}, "
+                f"95% CI {low:6.1%}-{high:6.1%})")
+        mean, margin = self.score()
+        lines.append(f"   score: {mean:.3f} +/- {margin:.3f}")
+        for name, times in self.move_times.items():
+            lines.append(
+                f"  {name}: move time p50 {percentile(times, 0.5) * 1000:.1f}ms, "
+                f"p90 {percentile(times, 0.9) * 1000:.1f}ms, "
+                f"p99 {percentile(times, 0.99) * 1000:.1f}ms, "
+                f"{self.iterations_per_second(name):.0f} iterations/sec")
+        return "\n".join(lines)
+
+
+def run_arena(
+        first_player: PlayerConfig,
+        second_player: PlayerConfig,
+        num_games: int,
+        num_workers: int=1,
+        seed: int=0,
+        board_size: int=3,
+        num_dimensions: int=2,
+        win_length: int=None) -> Iterator[Tuple[GameResult, ArenaStats]]:
+    """
+    Play games between the two players (swapping who plays X each game) and
+    yield each game's result along with the running stats as they finish.
+    With more than one worker, games are played in a process pool.
+    """
+    if first_player.name == second_player.name:
+        raise ValueError("The players need different names")
+    stats = ArenaStats(first_player.name, second_player.name)
+    rng = random.Random(seed)
+    games = []
+    for game_index in range(num_games):
+        x_player, o_player = first_player, second_player
+        if game_index % 2:
+            x_player, o_player = o_player, x_player
+        games.append((
+            x_player, o_player, rng.getrandbits(64), game_index,
+            board_size, num_dimensions, win_length))
+
+    if num_workers <= 1:
+        for game in games:
+            result = play_game(*game)
+            stats.add(result)
+            yield result, stats
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(num_workers) as executor:
+        futures = [executor.submit(play_game, *game) for game in games]
+        try:
+            for future in concurrent.futures.as_completed(futures):
+                result = future.result()
+                stats.add(result)
+                yield result, stats
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("first_player", help="e.g. mcts:iterations=1000,use_solver=true")
+    parser.add_argument("second_player", help="e.g. random")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--report-every", type=int, default=10,
+                        help="Print the running stats after this many games")
+    parser.add_argument("--board-size", type=int, default=3)
+    parser.add_argument("--dimensions", type=int, default=2)
+    parser.add_argument("--win-length", type=int, default=None)
+    args = parser.parse_args()
+
+    first_player = parse_player(args.first_player, "A")
+    second_player = parse_player(args.second_player, "B")
+    print(f"A = {args.first_player}, B = {args.second_player}")
+    stats = None
+    for _, stats in run_arena(
+            first_player, second_player, args.games, args.workers, args.seed,
+            args.board_size, args.dimensions, args.win_length):
+        if stats.num_games % args.report_every == 0 and stats.num_games < args.games:
+            print(stats.summary(), flush=True)
+    if stats is not None:
+        print(stats.summary())
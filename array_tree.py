@@ -0,0 +1,149 @@
+"""
+A compact MCTS tree that stores its nodes as parallel arrays instead of one
+Python object per node.
+"""
+import array
+import math
+from typing import List
+
+from agents import ucb1_score
+
+try:
+    import numpy as np
+except ImportError:
+    # NumPy is optional; without it, child selection always loops in Python
+    np = None
+
+
+ROOT = 0
+# Nodes with at least this many children pick their best child with NumPy,
+# where it's faster than looping in Python
+VECTORIZE_MIN_CHILDREN = 32
+
+
+class ArrayTree:
+    """
+    An MCTS tree stored as a structure of arrays, indexed by node number.
+
+    Each node's children are allocated next to each other when it's expanded,
+    so a node only needs to store where its first child is and how many
+    children it has. The arrays are preallocated and grown by ``chunk_size``
+    nodes at a time.
+
+    Like ``MCTSNode``, each node holds the score of the player who took the
+    action leading to it.
+    """
+    def __init__(self, chunk_size: int=4096):
+        self.chunk_size = chunk_size
+        self.times_visited = array.array("i")
+        self.total_scores = array.array("d")
+        # The flat cell index the action leading to each node was played on
+        self.action_cells = array.array("i")
+        self.first_child = array.array("i")
+        self.child_count = array.array("H")
+        self.num_nodes = 0
+        self._add_nodes(1)
+
+    @property
+    def bytes_per_node(self) -> int:
+        return sum(values.itemsize for values in self._arrays())
+
+    @property
+    def capacity(self) -> int:
+        return len(self.times_visited)
+
+    def memory_usage(self) -> int:
+        """
+        Get the number of bytes allocated for node storage (including spare
+        capacity)
+        """
+        return self.capacity * self.bytes_per_node
+
+    def _arrays(self) -> List[array.array]:
+        return [
+            self.times_visited,
+            self.total_scores,
+            self.action_cells,
+            self.first_child,
+            self.child_count,
+        ]
+
+    def _add_nodes(self, num_nodes: int) -> int:
+        """
+        Allocate the given number of contiguous new nodes and return the index
+        of the first one
+        """
+        first_node = self.num_nodes
+        self.num_nodes += num_nodes
+        while self.num_nodes > self.capacity:
+            for values in self._arrays():
+                # All-zero bytes are zero for every array type
+                values.frombytes(bytes(values.itemsize * self.chunk_size))
+        return first_node
+
+    def expand(self, node: int, action_cells: List[int]):
+        """
+        Add a child to the node for each of the given actions
+        """
+        first_child = self._add_nodes(len(action_cells))
+        self.first_child[node] = first_child
+        self.child_count[node] = len(action_cells)
+        for i, cell in enumerate(action_cells):
+            self.action_cells[first_child + i] = cell
+
+    def get_children(self, node: int) -> range:
+        first_child = self.first_child[node]
+        return range(first_child, first_child + self.child_count[node])
+
+    def update(self, node: int, score: float):
+        self.times_visited[node] += 1
+        self.total_scores[node] += score
+
+    def average_score(self, node: int) -> float:
+        if self.times_visited[node] == 0:
+            return 0
+        return self.total_scores[node] / self.times_visited[node]
+
+    def get_best_child(self, node: int, exploration_rate: float=2.0, vectorized: bool=None) -> int:
+        """
+        Get the child with the highest UCB1 score (see ``agents.ucb1_score()``),
+        preferring unvisited children.
+
+        Wide nodes are scored in one vectorized pass over their children's
+        slice of the arrays if NumPy is installed (``vectorized`` forces
+        either way).
+        """
+        if vectorized is None:
+            vectorized = np is not None and self.child_count[node] >= VECTORIZE_MIN_CHILDREN
+        if vectorized:
+            return self._get_best_child_vectorized(node, exploration_rate)
+
+        best_child, best_score = None, -math.inf
+        log_parent_visits = math.log(max(self.times_visited[node], 1))
+        for child in self.get_children(node):
+            times_visited = self.times_visited[child]
+            if times_visited == 0:
+                return child
+            score = ucb1_score(
+                self.total_scores[child] / times_visited, times_visited, log_parent_visits, exploration_rate)
+            if score > best_score:
+                best_child, best_score = child, score
+        return best_child
+
+    def _get_best_child_vectorized(self, node: int, exploration_rate: float) -> int:
+        first_child = self.first_child[node]
+        child_count = self.child_count[node]
+        # Zero-copy views of the children's contiguous slices of the arrays
+        times_visited, total_scores = (
+            np.frombuffer(
+                values, dtype=values.typecode, count=child_count,
+                offset=first_child * values.itemsize)
+            for values in (self.times_visited, self.total_scores)
+        )
+        unvisited = np.flatnonzero(times_visited == 0)
+        if len(unvisited):
+            return first_child + int(unvisited[0])
+        log_parent_visits = math.log(max(self.times_visited[node], 1))
+        scores = ucb1_score(
+            total_scores / times_visited, times_visited, log_parent_visits, exploration_rate, np.sqrt)
+        return first_child + int(np.argmax(scores))
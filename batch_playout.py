@@ -0,0 +1,92 @@
+"""
+Runs many random playouts from the same position at once with NumPy, instead
+of one game at a time in pure Python.
+
+This needs NumPy (``pip install numpy``).
+"""
+import functools
+from typing import Dict
+
+import numpy as np
+
+from agents import GameState, get_playout_scores
+from game import Mark, get_cell_points, get_win_lines
+
+
+# The value each mark is stored as in the board arrays
+_MARK_VALUES = {Mark.BLANK: 0, Mark.X: 1, Mark.O: 2}
+
+
+@functools.lru_cache(maxsize=None)
+def _get_win_line_matrix(board_size: int, num_dimensions: int, win_length: int) -> np.ndarray:
+    """
+    Get every winning line as a (num_lines, win_length) array of flat cell
+    indices
+    """
+    return np.array(get_win_lines(board_size, num_dimensions, win_length), dtype=np.intp)
+
+
+class BatchPlayouts:
+    """
+    Plays ``batch_size`` random games to completion from a position in one
+    vectorized pass and averages their results.
+
+    Each game fills the empty cells in a random order. Rather than stepping
+    through the moves, every cell is tagged with the turn it was filled on, so
+    a line is won on the turn its last cell was filled and each game's winner
+    is whoever completed a line first.
+    """
+    def __init__(self, batch_size: int=256, seed: int=None):
+        self.batch_size = batch_size
+        self.seed(seed)
+
+    def seed(self, seed: int=None):
+        self._rng = np.random.default_rng(seed)
+
+    def playout(self, state: GameState, player: Mark) -> Dict[Mark, float]:
+        """
+        Returns the average scores over the batch of playouts (see
+        ``agents.get_playout_scores()``).
+        """
+        if state.is_terminal():
+            win_rate = 1.0 if state.winner == player else 0.0
+            draw_rate = 1.0 if state.winner is None else 0.0
+            return get_playout_scores(state, player, win_rate, draw_rate)
+
+        board = state.board
+        cells = np.array(
+            [_MARK_VALUES[board.get_mark(point)]
+             for point in get_cell_points(board.board_size, board.num_dimensions)],
+            dtype=np.int8)
+        empty_cells = np.flatnonzero(cells == 0)
+        num_empty = len(empty_cells)
+
+        # The turn each cell gets filled on in each game (-1 if it already was)
+        fill_order = self._rng.random((self.batch_size, num_empty)).argsort(axis=1)
+        fill_turns = np.full((self.batch_size, len(cells)), -1, dtype=np.int32)
+        rows = np.arange(self.batch_size)[:, np.newaxis]
+        fill_turns[rows, empty_cells[fill_order]] = np.arange(num_empty)
+
+        # The player to move fills the cells on even turns
+        first_mark = _MARK_VALUES[state.player]
+        second_mark = _MARK_VALUES[state.get_next_player(state.player)]
+        final_cells = np.where(
+            fill_turns < 0,
+            cells,
+            np.where(fill_turns % 2 == 0, first_mark, second_mark)
+        ).astype(np.int8)
+
+        lines = _get_win_line_matrix(board.board_size, board.num_dimensions, board.win_length)
+        line_marks = final_cells[:, lines]
+        line_finish_turns = fill_turns[:, lines].max(axis=2)
+        no_win = np.iinfo(np.int32).max
+        first_win_turns = {}
+        for mark in (Mark.X, Mark.O):
+            is_complete = (line_marks == _MARK_VALUES[mark]).all(axis=2)
+            first_win_turns[mark] = np.where(
+                is_complete, line_finish_turns, no_win).min(axis=1)
+
+        other = state.get_next_player(player)
+        player_wins = first_win_turns[player] < first_win_turns[other]
+        draws = (first_win_turns[player] == no_win) & (first_win_turns[other] == no_win)
+        return get_playout_scores(state, player, player_wins.mean(), draws.mean())
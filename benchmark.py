@@ -0,0 +1,388 @@
+"""
+Measure how quickly the MCTS agent can search.
+
+Usage: python benchmark.py [--duration SECONDS] [--workers 1 2 4 ...]
+
+Or, to time each of the search's hot paths and save the results as JSON
+(failing if any got slower than a saved baseline by more than the threshold):
+
+    python benchmark.py --suite [--output results.json] [--baseline baseline.json] [--threshold 0.2]
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+from agents import Action, GameState, MCTSAgent, MCTSNode
+from array_tree import ROOT, ArrayTree
+from game import BitBoard, Board, Mark, Point, decode_board, get_cell_points
+from rollout import ROLLOUT_POLICIES
+
+
+def measure_playout_rate(board_type: type, duration: float=2.0) -> float:
+    """
+    Returns how many full random playouts from an empty board can be run per
+    second using the given board type.
+    """
+    agent = MCTSAgent(seed=0)
+    state = GameState(board_type(), Mark.X)
+    num_playouts = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        agent.playout(state, Mark.X)
+        num_playouts += 1
+    return num_playouts / (time.perf_counter() - start)
+
+
+def measure_parallel_rate(num_workers: int, iterations_per_worker: int=2000) -> float:
+    """
+    Returns how many MCTS iterations per second a root-parallel search from an
+    empty board runs with the given number of workers (not counting the time
+    to start the worker processes).
+    """
+    agent = MCTSAgent(num_workers=num_workers, seed=0)
+    state = GameState(BitBoard(), Mark.X)
+    try:
+        # Warm up the pool so process startup isn't counted
+        agent.search(state, iterations=1)
+        start = time.perf_counter()
+        agent.search(state, iterations=iterations_per_worker)
+        elapsed = time.perf_counter() - start
+    finally:
+        agent.close()
+    return num_workers * iterations_per_worker / elapsed
+
+
+def measure_node_memory(iterations: int=5000) -> dict:
+    """
+    Returns the bytes used per search tree node by ``MCTSNode`` objects
+    (measured with tracemalloc) and by ``ArrayTree`` storage.
+    """
+    state = GameState(BitBoard(), Mark.X)
+    tracemalloc.start()
+    root = MCTSAgent(seed=0).search(state, iterations)
+    node_bytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    agent = MCTSAgent(use_array_tree=True, seed=0)
+    agent.search(state, iterations)
+    return {
+        "MCTSNode": node_bytes / root.num_nodes,
+        "ArrayTree": agent.array_tree.bytes_per_node,
+    }
+
+
+def measure_selection_time(board_size: int=15, number: int=2000) -> dict:
+    """
+    Returns the microseconds taken to pick the best child of a node with a
+    child per cell of an empty board, using each selection method.
+    """
+    rng = random.Random(0)
+    stats = [(rng.randint(1, 50), rng.random()) for _ in range(board_size * board_size)]
+
+    node = MCTSNode()
+    tree = ArrayTree()
+    tree.expand(ROOT, list(range(len(stats))))
+    for point, child, (times_visited, win_rate) in zip(
+            get_cell_points(board_size, 2), tree.get_children(ROOT), stats):
+        action = Action(point, Mark.X)
+        node.children[action] = MCTSNode(action)
+        node.children[action].times_visited = times_visited
+        node.children[action].total_score = win_rate * times_visited
+        tree.times_visited[child] = times_visited
+        tree.total_scores[child] = win_rate * times_visited
+    node.times_visited = tree.times_visited[ROOT] = sum(visits for visits, _ in stats)
+
+    selectors = {
+        "MCTSNode": node.get_best_child,
+        "ArrayTree loop": lambda: tree.get_best_child(ROOT, vectorized=False),
+    }
+    try:
+        import numpy
+        selectors["ArrayTree vectorized"] = lambda: tree.get_best_child(ROOT, vectorized=True)
+    except ImportError:
+        pass
+    return {
+        name: timeit.timeit(selector, number=number) / number * 1e6
+        for name, selector in selectors.items()
+    }
+
+
+# Positions with only one good move, as the board, the player to move, the
+# win length and the move
+CORRECT_MOVE_POSITIONS = [
+    ("..O.XXX.O", Mark.O, None, Point(1,0)),
+    (".....O....XXX...O........", Mark.O, 4, Point(2,3)),
+]
+
+
+def measure_time_to_correct_move(
+        rollout_policy: str=None,
+        num_seeds: int=10,
+        max_iterations: int=3200,
+        success_rate: float=0.8,
+        use_rave: bool=False) -> dict:
+    """
+    Returns how long searches with the given rollout policy (and RAVE, if
+    ``use_rave`` is set) take to find the right move in each of ``CORRECT_MOVE_POSITIONS``: the fewest iterations
+    (doubling from 25) at which at least ``success_rate`` of the seeds found
+    it, and the median time that search took (both None if it was never
+    found that often).
+    """
+    results = {}
+    for cells, player, win_length, move in CORRECT_MOVE_POSITIONS:
+        state = GameState(decode_board(cells, win_length=win_length), player)
+        results[cells] = {"iterations": None, "seconds": None, "success_rate": 0.0}
+        iterations = 25
+        while iterations <= max_iterations:
+            times = []
+            num_found = 0
+            for seed in range(num_seeds):
+                agent = MCTSAgent(rollout_policy=rollout_policy, use_rave=use_rave, seed=seed)
+                start = time.perf_counter()
+                num_found += agent.get_move(state, iterations).pos == move
+                times.append(time.perf_counter() - start)
+            if num_found / num_seeds >= success_rate:
+                results[cells] = {
+                    "iterations": iterations,
+                    "seconds": statistics.median(times),
+                    "success_rate": num_found / num_seeds,
+                }
+                break
+            iterations *= 2
+    return results
+
+
+def _get_midgame_state(board_type: type, board_size: int) -> GameState:
+    """
+    Get a state with about a third of the board filled in and no winner yet
+    """
+    rng = random.Random(0)
+    state = GameState(board_type(board_size), Mark.X)
+    while state.num_empty > 2 * board_size ** 2 // 3:
+        action = rng.choice(state.get_actions())
+        state.apply_action(action)
+        if state.is_terminal():
+            state.undo_action()
+            break
+    return state
+
+
+def get_suite_benchmarks(
+        board_sizes: Tuple[int, ...]=(3, 4),
+        iteration_counts: Tuple[int, ...]=(100, 1000)) -> Dict[str, Callable[[], object]]:
+    """
+    Get the operations to time in the benchmark suite, by name
+    """
+    benchmarks = {}
+    for board_type in [Board, BitBoard]:
+        for board_size in board_sizes:
+            state = _get_midgame_state(board_type, board_size)
+            suffix = f"{board_type.__name__}-{board_size}"
+            benchmarks[f"check_if_win_anywhere/{suffix}"] = (
+                lambda board=state.board: board.check_if_win_anywhere(Mark.X))
+            benchmarks[f"get_available_spaces/{suffix}"] = state.board.get_available_spaces
+            benchmarks[f"get_next_state/{suffix}"] = (
+                lambda state=state, action=state.get_actions()[0]: state.get_next_state(action))
+            benchmarks[f"playout/{suffix}"] = (
+                lambda state=state, agent=MCTSAgent(seed=0): agent.playout(state, state.player))
+
+    for board_size in board_sizes:
+        num_children = board_size ** 2
+        node = MCTSNode()
+        rng = random.Random(0)
+        for point in get_cell_points(board_size, 2):
+            child = node.children[Action(point, Mark.X)] = MCTSNode(Action(point, Mark.X))
+            child.times_visited = rng.randint(1, 50)
+            child.total_score = rng.random() * child.times_visited
+            node.times_visited += child.times_visited
+        benchmarks[f"get_best_child/{num_children}-children"] = node.get_best_child
+
+    for board_size in board_sizes:
+        for iterations in iteration_counts:
+            benchmarks[f"get_move/BitBoard-{board_size}/{iterations}-iterations"] = (
+                lambda state=GameState(BitBoard(board_size), Mark.X), iterations=iterations:
+                    MCTSAgent(seed=0).get_move(state, iterations))
+    return benchmarks
+
+
+def time_benchmark(benchmark: Callable[[], object], repeats: int=5, min_time: float=0.2) -> dict:
+    """
+    Time a benchmark, returning the seconds per call over each of ``repeats``
+    runs. A warmup run first picks how many calls each run makes so it takes
+    at least ``min_time`` seconds.
+    """
+    timer = timeit.Timer(benchmark)
+    number = 1
+    while True:
+        # Also warms up caches (e.g. win line tables) before timing
+        if timer.timeit(number) >= min_time:
+            break
+        number *= 2
+    times = [elapsed / number for elapsed in timer.repeat(repeat=repeats, number=number)]
+    return {
+        "median": statistics.median(times),
+        "min": min(times),
+        "mean": statistics.mean(times),
+        "stdev": statistics.stdev(times) if len(times) > 1 else 0.0,
+        "repeats": repeats,
+        "calls_per_repeat": number,
+    }
+
+
+def get_environment() -> dict:
+    """
+    Get the commit and environment the benchmarks were run in
+    """
+    def run_git(*args) -> str:
+        try:
+            return subprocess.run(
+                ["git", *args], capture_output=True, text=True, check=True,
+                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    try:
+        import numpy
+        numpy_version = numpy.__version__
+    except ImportError:
+        numpy_version = None
+    status = run_git("status", "--porcelain", "--untracked-files=no")
+    return {
+        "commit": run_git("rev-parse", "HEAD"),
+        "dirty": bool(status) if status is not None else None,
+        "python": sys.version,
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "numpy": numpy_version,
+    }
+
+
+def run_suite(repeats: int=5, min_time: float=0.2, verbose: bool=True) -> dict:
+    results = {}
+    for name, benchmark in get_suite_benchmarks().items():
+        results[name] = time_benchmark(benchmark, repeats, min_time)
+        if verbose:
+            print(f"{name:>45}: {results[name]['median'] * 1e6:12.2f} us", flush=True)
+    return {
+        "environment": get_environment(),
+        "timestamp": time.time(),
+        "results": results,
+    }
+
+
+def compare_to_baseline(suite_results: dict, baseline: dict, threshold: float=0.2) -> List[dict]:
+    """
+    Get the benchmarks whose median time is more than ``threshold`` (as a
+    fraction) slower than in the baseline. Benchmarks missing from either are
+    skipped.
+    """
+    regressions = []
+    for name, result in suite_results["results"].items():
+        baseline_result = baseline["results"].get(name)
+        if baseline_result is None:
+            continue
+        ratio = result["median"] / baseline_result["median"]
+        if ratio > 1 + threshold:
+            regressions.append({
+                "name": name,
+                "baseline": baseline_result["median"],
+                "current": result["median"],
+                "ratio": ratio,
+            })
+    return regressions
+
+
+def main_suite(output: str, baseline_path: str, threshold: float, repeats: int, min_time: float) -> int:
+    """
+    Runs the benchmark suite and returns the exit code (1 if anything
+    regressed past the threshold)
+    """
+    suite_results = run_suite(repeats, min_time)
+    if output:
+        with open(output, "w") as output_file:
+            json.dump(suite_results, output_file, indent=2)
+    if not baseline_path:
+        return 0
+
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)
+    regressions = compare_to_baseline(suite_results, baseline, threshold)
+    print(f"Compared to {baseline_path} (commit {baseline['environment'].get('commit')}):")
+    for regression in regressions:
+        print(
+            f"  REGRESSION {regression['name']}: {regression['baseline'] * 1e6:.2f} us -> "
+            f"{regression['current'] * 1e6:.2f} us ({regression['ratio']:.2f}x)")
+    if not regressions:
+        print(f"  No benchmarks regressed by more than {threshold:.0%}")
+    return 1 if regressions else 0
+
+
+def main(duration: float, worker_counts: List[int], policies: List[str]):
+    rates = {
+        board_type.__name__: measure_playout_rate(board_type, duration)
+        for board_type in [Board, BitBoard]
+    }
+    for name, rate in rates.items():
+        print(f"{name:>10}: {rate:10.1f} playouts/sec")
+    print(f"BitBoard speedup: {rates['BitBoard'] / rates['Board']:.2f}x")
+
+    print("Tree memory:")
+    for name, bytes_per_node in measure_node_memory().items():
+        print(f"{name:>10}: {bytes_per_node:10.1f} bytes/node")
+
+    print("Selecting among 225 children:")
+    for name, microseconds in measure_selection_time().items():
+        print(f"{name:>20}: {microseconds:8.1f} us")
+
+    print("Time to find the only good move, by rollout policy (with and without RAVE):")
+    for policy, use_rave in itertools.product(policies, [False, True]):
+        rollout_policy = None if policy == "default" else policy
+        name = f"{policy}+rave" if use_rave else policy
+        for cells, result in measure_time_to_correct_move(rollout_policy, use_rave=use_rave).items():
+            if result["iterations"] is None:
+                print(f"{name:>21} {cells:>25}: not found reliably")
+                continue
+            print(
+                f"{name:>21} {cells:>25}: {result['seconds'] * 1000:8.1f} ms "
+                f"({result['iterations']} iterations, {result['success_rate']:.0%} of seeds)")
+
+    print("Root-parallel search:")
+    for num_workers in worker_counts:
+        rate = measure_parallel_rate(num_workers)
+        print(f"{num_workers:>4} workers: {rate:10.1f} iterations/sec")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--duration", type=float, default=2.0,
+                        help="Seconds to run playouts for on each board type")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4],
+                        help="Worker counts to measure parallel search with")
+    parser.add_argument("--policies", nargs="+", default=["default", *ROLLOUT_POLICIES],
+                        help="Rollout policies to compare (\"default\" is the built-in random playout)")
+    parser.add_argument("--suite", action="store_true",
+                        help="Time each hot path instead and report the results as JSON")
+    parser.add_argument("--output", help="Where to save the suite's JSON results")
+    parser.add_argument("--baseline", help="Saved suite results to check for regressions against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="How much slower (as a fraction) than the baseline counts as a regression")
+    parser.add_argument("--repeats", type=int, default=5,
+                        help="How many timed runs of each suite benchmark to make")
+    parser.add_argument("--min-time", type=float, default=0.2,
+                        help="The minimum seconds each timed run takes")
+    args = parser.parse_args()
+    if args.suite:
+        sys.exit(main_suite(args.output, args.baseline, args.threshold, args.repeats, args.min_time))
+    main(args.duration, args.workers, args.policies)
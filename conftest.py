@@ -0,0 +1,40 @@
+import pytest
+
+from agents import GameState
+from game import BitBoard, Board, Mark, decode_board
+
+
+@pytest.fixture(params=[Board, BitBoard])
+def board_type(request) -> type:
+    return request.param
+
+
+@pytest.fixture
+def board(board_type: type) -> Board:
+    return board_type()
+
+
+@pytest.fixture
+def win_state(board_type: type) -> GameState:
+    """
+    ======
+    O| |O
+     |X|X
+    X| |
+    ======
+    O to move wins at 0,1
+    """
+    return GameState(decode_board("O.O.XXX..", board_type=board_type), Mark.O)
+
+
+@pytest.fixture
+def block_state(board_type: type) -> GameState:
+    """
+    ======
+    O| |O
+     |X|
+    X| |
+    ======
+    X to move has to block at 0,1
+    """
+    return GameState(decode_board("O.O.X.X..", board_type=board_type), Mark.X)
@@ -0,0 +1,242 @@
+"""
+Finds the best move and value of many positions at once, e.g. to analyze
+logged games.
+
+Usage:
+
+    python evaluate.py positions.txt --iterations 1000 --workers 4 > results.jsonl
+
+Each input line is a board in the ``game.encode_board()`` format, optionally
+followed by a space and the player to move (by default X if both players
+have made the same number of moves, and O otherwise). A JSON result is
+written for each line, in the same order.
+"""
+import argparse
+import collections
+import concurrent.futures
+import dataclasses
+import json
+import sys
+from typing import Deque, Dict, Hashable, Iterable, Iterator, Tuple
+
+from agents import GameState, MCTSAgent
+from game import BitBoard, Mark, Point, decode_board, get_cell_index, get_cell_points
+
+
+@dataclasses.dataclass
+class PositionEvaluation:
+    position: str
+    player: Mark
+    # The best move, or None if the game is already over
+    move: Point
+    # The best move's average score from the search (where losses count as
+    # -1), or the proven score if there is one
+    value: float
+    # 1.0, 0.5 or 0.0 if the solver proved the position is a win, draw or loss
+    # for the player to move, and None otherwise
+    proven_score: float
+    # Whether the result came from an earlier evaluation of the same (or a
+    # symmetric) position
+    cached: bool=False
+
+    def to_dict(self) -> dict:
+        return {
+            "position": self.position,
+            "player": self.player.name,
+            "move": list(self.move.coords) if self.move else None,
+            "value": self.value,
+            "proven_score": self.proven_score,
+            "cached": self.cached,
+        }
+
+
+# The result of evaluating a canonical position: the best move's flat cell
+# index (or None), the value and the proven score
+_Result = Tuple[int, float, float]
+
+
+def parse_position(position: str, num_dimensions: int=2, win_length: int=None) -> GameState:
+    """
+    Get the state for a position like ``"X...O...."`` or ``"X...O.... X"``
+    """
+    cells, _, player_name = position.strip().partition(" ")
+    board = decode_board(cells, num_dimensions, win_length)
+    if player_name:
+        player = Mark[player_name.strip().upper()]
+    else:
+        player = Mark.X if cells.upper().count("X") == cells.upper().count("O") else Mark.O
+    return GameState(board, player)
+
+
+def _get_canonical_state(state: GameState, symmetry_index: int) -> GameState:
+    board = state.board
+    symmetries = state.get_symmetries()
+    canonical_board = BitBoard(board.board_size, board.num_dimensions, board.win_length)
+    for point in get_cell_points(board.board_size, board.num_dimensions):
+        mark = board.get_mark(point)
+        if mark != Mark.BLANK:
+            canonical_board.set_mark(symmetries.transform_point(point, symmetry_index), mark)
+    return GameState(canonical_board, state.player)
+
+
+def _evaluate(agent_options: dict, state: GameState, iterations: int, seed: int) -> _Result:
+    """
+    Search a position and return its best move and value
+    """
+    if state.is_terminal():
+        score = state.get_score(state.player)
+        return None, score, score
+    with MCTSAgent(**{"use_solver": True, **agent_options, "seed": seed}) as agent:
+        root = agent.search(state, iterations)
+        action = agent.get_best_move(root)
+    child = root.children[action]
+    board = state.board
+    cell = get_cell_index(action.pos, board.board_size, board.num_dimensions)
+    proven_score = root.proven_score
+    if proven_score is not None:
+        # The root's proven score is for the player who moved into it
+        proven_score = 1.0 - proven_score
+    value = child.average_score() if child.proven_score is None else child.proven_score
+    return cell, value, proven_score
+
+
+class PositionEvaluator:
+    """
+    Evaluates streams of positions, searching each distinct position (up to
+    symmetry) only once.
+
+    Searches run ``iterations`` MCTS-Solver iterations with the given
+    ``MCTSAgent`` options, in a process pool if ``num_workers`` is more than
+    1. Results are kept in an LRU cache of up to ``cache_size`` positions that
+    persists between calls to ``evaluate()``, and at most ``max_pending``
+    inputs are held at once while waiting for their results.
+    """
+    def __init__(
+            self,
+            iterations: int=1000,
+            num_workers: int=1,
+            agent_options: dict=None,
+            cache_size: int=100_000,
+            max_pending: int=None):
+        self.iterations = iterations
+        self.num_workers = num_workers
+        self.agent_options = dict(agent_options or {})
+        self.cache_size = cache_size
+        self.max_pending = max_pending or 8 * num_workers
+        self._cache: Dict[Hashable, _Result] = collections.OrderedDict()
+        self._executor = None
+        if num_workers > 1:
+            self._executor = concurrent.futures.ProcessPoolExecutor(num_workers)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self) -> "PositionEvaluator":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _get_cached(self, key: Hashable) -> _Result:
+        result = self._cache.get(key)
+        if result is not None:
+            self._cache.move_to_end(key)
+        return result
+
+    def _add_to_cache(self, key: Hashable, result: _Result):
+        self._cache[key] = result
+        self._cache.move_to_end(key)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def evaluate(
+            self,
+            positions: Iterable[str],
+            num_dimensions: int=2,
+            win_length: int=None) -> Iterator[PositionEvaluation]:
+        """
+        Yield the evaluation of each position (see ``parse_position()``) in
+        the same order as the input.
+        """
+        # Each pending input's state, symmetry, whether its result is shared
+        # with an earlier input, and the future computing its result
+        pending: Deque[tuple] = collections.deque()
+        in_flight: Dict[Hashable, concurrent.futures.Future] = {}
+
+        def finish_next() -> PositionEvaluation:
+            position, state, key, symmetry_index, cached, future = pending.popleft()
+            result = future.result()
+            if in_flight.get(key) is future:
+                del in_flight[key]
+                self._add_to_cache(key, result)
+            cell, value, proven_score = result
+            move = None
+            if cell is not None:
+                board = state.board
+                canonical_move = get_cell_points(board.board_size, board.num_dimensions)[cell]
+                move = state.get_symmetries().untransform_point(canonical_move, symmetry_index)
+            return PositionEvaluation(position, state.player, move, value, proven_score, cached)
+
+        for position in positions:
+            state = parse_position(position, num_dimensions, win_length)
+            board = state.board
+            canonical_hash, symmetry_index = state.get_symmetries().get_canonical_form(board)
+            key = (board.board_size, board.num_dimensions, board.win_length, canonical_hash, state.player)
+
+            future = in_flight.get(key)
+            cached = future is not None
+            if future is None:
+                future = concurrent.futures.Future()
+                result = self._get_cached(key)
+                if result is not None:
+                    cached = True
+                    future.set_result(result)
+                else:
+                    canonical_state = _get_canonical_state(state, symmetry_index)
+                    # Seeded by the position, so results don't depend on the order
+                    seed = canonical_hash ^ state.player.value
+                    if self._executor is not None:
+                        future = self._executor.submit(
+                            _evaluate, self.agent_options, canonical_state, self.iterations, seed)
+                    else:
+                        future.set_result(
+                            _evaluate(self.agent_options, canonical_state, self.iterations, seed))
+                    in_flight[key] = future
+            pending.append((position, state, key, symmetry_index, cached, future))
+
+            while pending and (len(pending) >= self.max_pending or pending[0][-1].done()):
+                yield finish_next()
+        while pending:
+            yield finish_next()
+
+
+def evaluate_positions(positions: Iterable[str], **options) -> Iterator[PositionEvaluation]:
+    """
+    Evaluate a stream of positions with a ``PositionEvaluator`` created with
+    the given options, closing it afterwards
+    """
+    with PositionEvaluator(**options) as evaluator:
+        yield from evaluator.evaluate(positions)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", nargs="?", help="File of positions, one per line (default: stdin)")
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--cache-size", type=int, default=100_000)
+    parser.add_argument("--agent-options", help='MCTSAgent options as JSON, e.g. \'{"use_symmetries": true}\'')
+    parser.add_argument("--dimensions", type=int, default=2)
+    parser.add_argument("--win-length", type=int, default=None)
+    args = parser.parse_args()
+
+    input_file = open(args.input) if args.input else sys.stdin
+    with input_file, PositionEvaluator(
+            args.iterations, args.workers,
+            json.loads(args.agent_options) if args.agent_options else None,
+            args.cache_size) as evaluator:
+        positions = (line.strip() for line in input_file if line.strip())
+        for evaluation in evaluator.evaluate(positions, args.dimensions, args.win_length):
+            print(json.dumps(evaluation.to_dict()))
@@ -1,11 +1,16 @@
 """
 The logic for playing a game of Tic-Tac-Toe (or "Naughts and Crosses" in the UK).
 
-This handles
+This handles boards of any size and number of dimensions, where a team wins by
+getting ``win_length`` of their marks in a straight line (e.g. 15x15
+five-in-a-row, or 4x4x4 3D tic-tac-toe).
 """
 import dataclasses
 import enum
-from typing import List
+import functools
+import itertools
+import random
+from typing import Dict, List, Tuple
 
 
 class Mark(enum.Enum):
@@ -18,106 +23,549 @@ class Mark(enum.Enum):
 class Point:
     row: int=0
     col: int=0
+    # Coordinates along any dimensions past the first two (e.g. which layer of
+    # a 3D board this is on)
+    layers: Tuple[int, ...]=()
+
+    @property
+    def coords(self) -> Tuple[int, ...]:
+        return (self.row, self.col) + self.layers
+
+
+def _check_board_config(board_size: int, num_dimensions: int, win_length: int):
+    if num_dimensions < 2:
+        raise ValueError(f"Boards need at least 2 dimensions, got {num_dimensions}")
+    if not 1 <= win_length <= board_size:
+        raise ValueError(
+            f"Win length must be between 1 and the board size ({board_size}), got {win_length}")
+
+
+def get_cell_index(position: Point, board_size: int, num_dimensions: int) -> int:
+    """
+    Get the flat index of a cell (row-major, so the last coordinate changes
+    fastest), or None if the point isn't on the board
+    """
+    coords = position.coords
+    if len(coords) != num_dimensions:
+        return None
+    index = 0
+    for coord in coords:
+        if not 0 <= coord < board_size:
+            return None
+        index = index * board_size + coord
+    return index
+
+
+@functools.lru_cache(maxsize=None)
+def get_cell_points(board_size: int, num_dimensions: int) -> Tuple[Point, ...]:
+    """
+    Get the point for every cell on the board, indexed by the cell's flat index
+    """
+    return tuple(
+        Point(coords[0], coords[1], tuple(coords[2:]))
+        for coords in itertools.product(range(board_size), repeat=num_dimensions)
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_win_lines(board_size: int, num_dimensions: int, win_length: int) -> Tuple[Tuple[int, ...], ...]:
+    """
+    Get every straight line of ``win_length`` cells on the board, as tuples of
+    flat cell indices. This is computed once per board configuration.
+    """
+    # Only keep one of each pair of opposite directions (the one whose first
+    # non-zero step is positive) so each line is only listed once
+    directions = [
+        direction
+        for direction in itertools.product((-1, 0, 1), repeat=num_dimensions)
+        if any(direction) and next(step for step in direction if step) > 0
+    ]
+    lines = []
+    for start in itertools.product(range(board_size), repeat=num_dimensions):
+        for direction in directions:
+            end = [coord + step * (win_length - 1) for coord, step in zip(start, direction)]
+            if not all(0 <= coord < board_size for coord in end):
+                continue
+            line = []
+            for i in range(win_length):
+                index = 0
+                for coord, step in zip(start, direction):
+                    index = index * board_size + coord + step * i
+                line.append(index)
+            lines.append(tuple(line))
+    return tuple(lines)
+
+
+@functools.lru_cache(maxsize=None)
+def get_cell_win_lines(board_size: int, num_dimensions: int, win_length: int) -> Tuple[Tuple[Tuple[int, ...], ...], ...]:
+    """
+    Get the winning lines that pass through each cell, indexed by the cell's
+    flat index, so checking a move only has to look at the lines it touches
+    """
+    cell_lines = [[] for _ in range(board_size ** num_dimensions)]
+    for line in get_win_lines(board_size, num_dimensions, win_length):
+        for index in line:
+            cell_lines[index].append(line)
+    return tuple(tuple(lines) for lines in cell_lines)
+
+
+@functools.lru_cache(maxsize=None)
+def get_zobrist_keys(board_size: int, num_dimensions: int) -> Tuple[Dict[Mark, int], ...]:
+    """
+    Get the random 64-bit Zobrist key for each mark in each cell, indexed by
+    the cell's flat index. A board's hash is the XOR of the keys of all its
+    marks, so it can be updated in constant time as marks are placed.
+
+    Blank cells have a key of 0 (so an empty board hashes to 0), and the keys
+    are seeded by the board configuration so hashes match across processes.
+    """
+    rng = random.Random(f"zobrist-{board_size}-{num_dimensions}")
+    return tuple(
+        {Mark.BLANK: 0, Mark.X: rng.getrandbits(64), Mark.O: rng.getrandbits(64)}
+        for _ in range(board_size ** num_dimensions)
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_symmetries(board_size: int, num_dimensions: int) -> Tuple[Tuple[int, ...], ...]:
+    """
+    Get every rotation and reflection of the board (8 for a square board, 48
+    for a cube), as permutations mapping each flat cell index to the index it
+    moves to. The identity is always first.
+    """
+    cell_points = get_cell_points(board_size, num_dimensions)
+    symmetries = []
+    for axis_order in itertools.permutations(range(num_dimensions)):
+        for flips in itertools.product((False, True), repeat=num_dimensions):
+            permutation = []
+            for point in cell_points:
+                coords = point.coords
+                index = 0
+                for axis, flip in zip(axis_order, flips):
+                    coord = board_size - 1 - coords[axis] if flip else coords[axis]
+                    index = index * board_size + coord
+                permutation.append(index)
+            symmetries.append(tuple(permutation))
+    return tuple(dict.fromkeys(symmetries))
+
+
+class BoardSymmetries:
+    """
+    Maps boards and moves to a canonical form that's the same for every
+    rotation/reflection of a position, so a search only needs to look at one
+    representative of each class of symmetric positions.
+
+    Use ``get_board_symmetries()`` to get the shared instance for a board size.
+    """
+    def __init__(self, board_size: int, num_dimensions: int):
+        self.board_size = board_size
+        self.num_dimensions = num_dimensions
+        self.permutations = get_symmetries(board_size, num_dimensions)
+        self._inverse_permutations = tuple(
+            tuple(sorted(range(len(permutation)), key=permutation.__getitem__))
+            for permutation in self.permutations
+        )
+        self._cell_points = get_cell_points(board_size, num_dimensions)
+        self._zobrist_keys = get_zobrist_keys(board_size, num_dimensions)
+
+    def _get_marks(self, board) -> List[Mark]:
+        return [board.get_mark(point) for point in self._cell_points]
+
+    def get_stabilizer(self, board) -> List[Tuple[int, ...]]:
+        """
+        Get the symmetries that leave the given board unchanged
+        """
+        marks = self._get_marks(board)
+        return [
+            permutation for permutation in self.permutations
+            if all(marks[permutation[i]] == mark for i, mark in enumerate(marks))
+        ]
+
+    def get_unique_spaces(self, board) -> List[Point]:
+        """
+        Get the available spaces, keeping only one of each group of spaces
+        that lead to symmetric positions
+        """
+        stabilizer = self.get_stabilizer(board)
+        unique_spaces = []
+        for point in board.get_available_spaces():
+            index = get_cell_index(point, self.board_size, self.num_dimensions)
+            if all(permutation[index] >= index for permutation in stabilizer):
+                unique_spaces.append(point)
+        return unique_spaces
+
+    def get_symmetric_hashes(self, board) -> List[int]:
+        """
+        Get the Zobrist hash of each symmetric version of the board, in the
+        same order as ``permutations``
+        """
+        occupied = [
+            (index, mark) for index, mark in enumerate(self._get_marks(board))
+            if mark != Mark.BLANK
+        ]
+        hashes = []
+        for permutation in self.permutations:
+            board_hash = 0
+            for index, mark in occupied:
+                board_hash ^= self._zobrist_keys[permutation[index]][mark]
+            hashes.append(board_hash)
+        return hashes
+
+    def get_canonical_form(self, board) -> Tuple[int, int]:
+        """
+        Get the canonical hash of the board (the smallest hash of any of its
+        symmetric versions) and the index of the symmetry that produces it
+        """
+        hashes = self.get_symmetric_hashes(board)
+        symmetry_index = min(range(len(hashes)), key=hashes.__getitem__)
+        return hashes[symmetry_index], symmetry_index
+
+    def get_canonical_hash(self, board) -> int:
+        return min(self.get_symmetric_hashes(board))
+
+    def get_canonical_hash_with_mark(self, symmetric_hashes: List[int], position: Point, mark: Mark) -> int:
+        """
+        Get the canonical hash a board would have after placing a mark on a
+        blank space, given the board's current ``get_symmetric_hashes()``
+        """
+        index = get_cell_index(position, self.board_size, self.num_dimensions)
+        return min(
+            board_hash ^ self._zobrist_keys[permutation[index]][mark]
+            for board_hash, permutation in zip(symmetric_hashes, self.permutations)
+        )
+
+    def transform_point(self, position: Point, symmetry_index: int) -> Point:
+        """
+        Map a point on the real board to where it is on the board transformed
+        by the given symmetry (e.g. into canonical form)
+        """
+        index = get_cell_index(position, self.board_size, self.num_dimensions)
+        return self._cell_points[self.permutations[symmetry_index][index]]
+
+    def untransform_point(self, position: Point, symmetry_index: int) -> Point:
+        """
+        Map a point on a transformed board (e.g. a move chosen in canonical
+        form) back to where it is on the real board
+        """
+        index = get_cell_index(position, self.board_size, self.num_dimensions)
+        return self._cell_points[self._inverse_permutations[symmetry_index][index]]
+
+
+@functools.lru_cache(maxsize=None)
+def get_board_symmetries(board_size: int, num_dimensions: int) -> BoardSymmetries:
+    return BoardSymmetries(board_size, num_dimensions)
+
+
+def _copy_cells(cells: list) -> list:
+    """
+    Copy a ``Board``'s nested lists of cells (the marks themselves are shared)
+    """
+    if cells and isinstance(cells[0], list):
+        return [_copy_cells(inner_cells) for inner_cells in cells]
+    return cells[:]
+
+
+def _board_to_str(board, board_size: int, num_dimensions: int) -> str:
+    """
+    Get a display string for a board, printing each 2D slice separately for
+    boards with more than 2 dimensions
+    """
+    display_chars = {
+        Mark.BLANK: " ",
+        Mark.X: "X",
+        Mark.O: "O"
+    }
+    display_string = "==" * board_size + "\n"
+    for layers in itertools.product(range(board_size), repeat=num_dimensions - 2):
+        if layers:
+            display_string += f"layers={layers}\n"
+        for row in range(board_size):
+            row_display_chars = [
+                display_chars[board.get_mark(Point(row, col, layers))]
+                for col in range(board_size)
+            ]
+            display_string += '|'.join(row_display_chars)
+            display_string += "\n"
+        display_string += "==" * board_size + "\n"
+    return display_string
 
 
 class Board:
     """
     The current state of the tic-tac-toe board
     """
-    def __init__(self, board_size: int=3, num_dimensions: int=2):
-        # TODO: Implement boards of different dimension than 2
+    def __init__(self, board_size: int=3, num_dimensions: int=2, win_length: int=None):
+        if win_length is None:
+            win_length = board_size
+        _check_board_config(board_size, num_dimensions, win_length)
         self._board = self._create_new_board(board_size, num_dimensions)
         self.board_size = board_size
+        self.num_dimensions = num_dimensions
+        self.win_length = win_length
+        self._cell_points = get_cell_points(board_size, num_dimensions)
+        self._win_lines = get_win_lines(board_size, num_dimensions, win_length)
+        self._cell_win_lines = get_cell_win_lines(board_size, num_dimensions, win_length)
+        self._zobrist_keys = get_zobrist_keys(board_size, num_dimensions)
+        self.zobrist_hash = 0
+
+    def __deepcopy__(self, memo: dict) -> "Board":
+        # The win and hash tables are shared and immutable, so only the cells
+        # need to be copied
+        new_board = Board.__new__(Board)
+        new_board.__dict__.update(self.__dict__)
+        new_board._board = _copy_cells(self._board)
+        return new_board
 
     def _create_new_board(self, board_size: int=3, num_dimensions_remaining: int=2) -> list:
         """
         Get a new blank tic-tac-toe board composed of nested lists.
         """
+        if num_dimensions_remaining <= 1:
+            return [Mark.BLANK] * board_size
         return [
-            [Mark.BLANK, Mark.BLANK, Mark.BLANK],
-            [Mark.BLANK, Mark.BLANK, Mark.BLANK],
-            [Mark.BLANK, Mark.BLANK, Mark.BLANK],
+            self._create_new_board(board_size, num_dimensions_remaining - 1)
+            for _ in range(board_size)
         ]
 
     def __str__(self) -> str:
-        display_chars = {
-            Mark.BLANK: " ",
-            Mark.X: "X",
-            Mark.O: "O"
-        }
-        display_string = "==" * self.board_size + "\n"
-        for row in self._board:
-            row_display_chars = [display_chars[mark] for mark in row]
-            display_string += '|'.join(row_display_chars)
-            display_string += "\n"
-        display_string += "==" * self.board_size + "\n"
-        return display_string
+        return _board_to_str(self, self.board_size, self.num_dimensions)
+
+    def _get_cell_list(self, position: Point) -> Tuple[list, int]:
+        """
+        Get the innermost list containing the given point and the point's index
+        in it, or None if the point isn't on the board
+        """
+        if get_cell_index(position, self.board_size, self.num_dimensions) is None:
+            return None
+        *outer_coords, last_coord = position.coords
+        cells = self._board
+        for coord in outer_coords:
+            cells = cells[coord]
+        return cells, last_coord
 
     def set_mark(self, position: Point, mark: Mark) -> bool:
-        try:
-            self._board[position.row][position.col] = mark
-        except IndexError:
+        cell = self._get_cell_list(position)
+        if cell is None:
             return None
+        cells, index = cell
+        cell_keys = self._zobrist_keys[get_cell_index(position, self.board_size, self.num_dimensions)]
+        self.zobrist_hash ^= cell_keys[cells[index]] ^ cell_keys[mark]
+        cells[index] = mark
+        if mark == Mark.BLANK:
+            # Clearing a cell (e.g. undoing a move) can't win anything
+            return False
         return self.check_if_win(position, mark)
 
     def get_mark(self, position: Point) -> Mark:
-        # Forgot that inn Python negative indices are valid
-        if position.col < 0 or position.row < 0:
+        cell = self._get_cell_list(position)
+        if cell is None:
+            return None
+        cells, index = cell
+        return cells[index]
+
+    def get_hash_with_mark(self, position: Point, mark: Mark) -> int:
+        """
+        Get the Zobrist hash this board would have if the given mark were
+        placed, without placing it
+        """
+        cell_keys = self._zobrist_keys[get_cell_index(position, self.board_size, self.num_dimensions)]
+        return self.zobrist_hash ^ cell_keys[self.get_mark(position)] ^ cell_keys[mark]
+
+    def _get_mark_at_index(self, index: int) -> Mark:
+        return self.get_mark(self._cell_points[index])
+
+    def get_available_spaces(self) -> List[Point]:
+        return [
+            point for point in self._cell_points
+            if self.get_mark(point) == Mark.BLANK
+        ]
+
+    def is_full(self) -> bool:
+        return not self.get_available_spaces()
+
+    def check_if_win(self, last_placement: Point, team: Mark) -> bool:
+        last_placed_mark = self.get_mark(last_placement)
+        if last_placed_mark != team:
+            # The place we're checking for a win doesn't belong to this team, so
+            # they can't have a winning position here
+            return False
+        index = get_cell_index(last_placement, self.board_size, self.num_dimensions)
+        return any(
+            self._check_win_line(line, team)
+            for line in self._cell_win_lines[index]
+        )
+
+    def check_if_win_anywhere(self, team: Mark) -> bool:
+        return any(self._check_win_line(line, team) for line in self._win_lines)
+
+    def _check_win_line(self, line: Tuple[int, ...], team: Mark) -> bool:
+        """
+        Check that every cell in the given line belongs to the team
+        """
+        return all(self._get_mark_at_index(index) == team for index in line)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_win_masks(board_size: int, num_dimensions: int, win_length: int) -> Tuple[int, ...]:
+    """
+    Get a bitmask for every winning line (bit ``i`` represents the cell with
+    flat index ``i``), computed once per board configuration
+    """
+    return tuple(
+        sum(1 << index for index in line)
+        for line in get_win_lines(board_size, num_dimensions, win_length)
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def _get_cell_win_masks(board_size: int, num_dimensions: int, win_length: int) -> Tuple[Tuple[int, ...], ...]:
+    """
+    Get the winning-line bitmasks that pass through each cell, indexed by the
+    cell's flat index
+    """
+    return tuple(
+        tuple(sum(1 << index for index in line) for line in lines)
+        for lines in get_cell_win_lines(board_size, num_dimensions, win_length)
+    )
+
+
+class BitBoard:
+    """
+    A tic-tac-toe board that stores each team's marks as an integer bitmask.
+
+    This has the same public interface as ``Board``, but answers win, draw and
+    available-space queries with mask operations instead of walking the grid,
+    which makes it much cheaper to use during MCTS playouts.
+    """
+    def __init__(self, board_size: int=3, num_dimensions: int=2, win_length: int=None):
+        if win_length is None:
+            win_length = board_size
+        _check_board_config(board_size, num_dimensions, win_length)
+        self.board_size = board_size
+        self.num_dimensions = num_dimensions
+        self.win_length = win_length
+        self._x_mask = 0
+        self._o_mask = 0
+        self._full_mask = (1 << (board_size ** num_dimensions)) - 1
+        self._cell_points = get_cell_points(board_size, num_dimensions)
+        self._win_masks = _get_win_masks(board_size, num_dimensions, win_length)
+        self._cell_win_masks = _get_cell_win_masks(board_size, num_dimensions, win_length)
+        self._zobrist_keys = get_zobrist_keys(board_size, num_dimensions)
+        self.zobrist_hash = 0
+
+    def __deepcopy__(self, memo: dict) -> "BitBoard":
+        # The win tables are shared and immutable, so only the marks need to
+        # be copied
+        new_board = BitBoard.__new__(BitBoard)
+        new_board.__dict__.update(self.__dict__)
+        return new_board
+
+    def __str__(self) -> str:
+        return _board_to_str(self, self.board_size, self.num_dimensions)
+
+    def _get_bit_index(self, position: Point) -> int:
+        return get_cell_index(position, self.board_size, self.num_dimensions)
+
+    def _get_team_mask(self, team: Mark) -> int:
+        if team == Mark.X:
+            return self._x_mask
+        if team == Mark.O:
+            return self._o_mask
+        return 0
+
+    def set_mark(self, position: Point, mark: Mark) -> bool:
+        index = self._get_bit_index(position)
+        if index is None:
             return None
-        try:
-            return self._board[position.row][position.col]
-        except IndexError:
+        bit = 1 << index
+        cell_keys = self._zobrist_keys[index]
+        self.zobrist_hash ^= cell_keys[self.get_mark(position)] ^ cell_keys[mark]
+        self._x_mask &= ~bit
+        self._o_mask &= ~bit
+        if mark == Mark.X:
+            self._x_mask |= bit
+        elif mark == Mark.O:
+            self._o_mask |= bit
+        else:
+            return False
+        return self.check_if_win(position, mark)
+
+    def get_mark(self, position: Point) -> Mark:
+        index = self._get_bit_index(position)
+        if index is None:
             return None
+        bit = 1 << index
+        if self._x_mask & bit:
+            return Mark.X
+        if self._o_mask & bit:
+            return Mark.O
+        return Mark.BLANK
+
+    def get_hash_with_mark(self, position: Point, mark: Mark) -> int:
+        """
+        Get the Zobrist hash this board would have if the given mark were
+        placed, without placing it
+        """
+        cell_keys = self._zobrist_keys[self._get_bit_index(position)]
+        return self.zobrist_hash ^ cell_keys[self.get_mark(position)] ^ cell_keys[mark]
 
     def get_available_spaces(self) -> List[Point]:
         available = []
-        for row_index, row in enumerate(self._board):
-            for col_index, mark in enumerate(row):
-                if mark == Mark.BLANK:
-                    available.append(Point(row_index, col_index))
+        blank_mask = self._full_mask & ~(self._x_mask | self._o_mask)
+        while blank_mask:
+            lowest_bit = blank_mask & -blank_mask
+            available.append(self._cell_points[lowest_bit.bit_length() - 1])
+            blank_mask ^= lowest_bit
         return available
 
+    def is_full(self) -> bool:
+        return (self._x_mask | self._o_mask) == self._full_mask
+
     def check_if_win(self, last_placement: Point, team: Mark) -> bool:
-        last_placed_mark = self.get_mark(last_placement)
-        if last_placed_mark != team:
+        index = self._get_bit_index(last_placement)
+        team_mask = self._get_team_mask(team)
+        if index is None or not team_mask & (1 << index):
             # The place we're checking for a win doesn't belong to this team, so
             # they can't have a winning position here
             return False
-        won_vertically = self._check_win_pos(last_placement, team, Point(1,0))
-        won_horizontally = self._check_win_pos(last_placement, team, Point(0,1))
-        won_diagonally_down = self._check_win_pos(last_placement, team, Point(1,1))
-        won_diagonally_up = self._check_win_pos(last_placement, team, Point(-1,1))
-        return won_vertically or won_horizontally or won_diagonally_down or won_diagonally_up
+        return any(
+            team_mask & line == line for line in self._cell_win_masks[index]
+        )
 
     def check_if_win_anywhere(self, team: Mark) -> bool:
-        for row_index, row in enumerate(self._board):
-            for col_index, mark in enumerate(row):
-                current_pos = Point(row_index, col_index)
-                if self.check_if_win(current_pos, team):
-                    return True
-        return False
-
-    def _check_win_pos(self, last_placement: Point, team: Mark, offset_dir: Point) -> bool:
-        """
-        Check that we have at least N marks in a straight line
-        """
-        num_matches = 0
-        if self.get_mark(last_placement) == team:
-            num_matches += 1
-
-        # check how many matching marks we have in a straight line going forward
-        current_pos = last_placement
-        for i in range(self.board_size):
-            current_pos = Point(current_pos.row + offset_dir.row, current_pos.col + offset_dir.col)
-            if self.get_mark(current_pos) == team:
-                num_matches += 1
-
-        # check how many matching marks we have in a straight line going backwards
-        current_pos = dataclasses.replace(last_placement)
-        for i in range(self.board_size):
-            current_pos = Point(current_pos.row - offset_dir.row, current_pos.col - offset_dir.col)
-            if self.get_mark(current_pos) == team:
-                num_matches += 1
-
-        assert num_matches <= self.board_size
-        return num_matches == self.board_size
+        team_mask = self._get_team_mask(team)
+        return any(team_mask & line == line for line in self._win_masks)
+
+
+_MARK_CHARS = {Mark.BLANK: ".", Mark.X: "X", Mark.O: "O"}
+_CHAR_MARKS = {char: mark for mark, char in _MARK_CHARS.items()}
+
+
+def encode_board(board) -> str:
+    """
+    Get a compact string of a board's cells in row-major order, e.g.
+    ``"X...O...."`` (the board size follows from its length)
+    """
+    return "".join(
+        _MARK_CHARS[board.get_mark(point)]
+        for point in get_cell_points(board.board_size, board.num_dimensions)
+    )
+
+
+def decode_board(cells: str, num_dimensions: int=2, win_length: int=None, board_type: type=None):
+    """
+    Create a board (a ``BitBoard`` unless another type is given) from a
+    string made by ``encode_board()``
+    """
+    if board_type is None:
+        board_type = BitBoard
+    board_size = round(len(cells) ** (1 / num_dimensions))
+    if board_size ** num_dimensions != len(cells):
+        raise ValueError(f"{len(cells)} cells isn't a {num_dimensions}D board")
+    board = board_type(board_size, num_dimensions, win_length)
+    for point, char in zip(get_cell_points(board_size, num_dimensions), cells.upper()):
+        if char not in _CHAR_MARKS:
+            raise ValueError(f"Invalid cell: {char!r}")
+        if char != _MARK_CHARS[Mark.BLANK]:
+            board.set_mark(point, _CHAR_MARKS[char])
+    return board
@@ -0,0 +1,276 @@
+"""
+An opening book: the visits and scores of the first few levels of MCTS search
+trees, saved to a compact binary file so later searches can start from them
+instead of an empty tree.
+
+Build (or add more searches to) one with:
+
+    python opening_book.py build book.ob --iterations 100000 --depth 4
+
+and combine books from separate runs with:
+
+    python opening_book.py merge book.ob run1.ob run2.ob
+
+Each entry is keyed by a canonical position (see ``BoardSymmetries``) and the
+player to move, and holds the stats of the move leading to it. Entries are
+stored as fixed-size records sorted by key, so a book is memory-mapped and
+searched in place rather than loaded, and books are merged by streaming
+through them in order.
+"""
+import argparse
+import contextlib
+import heapq
+import mmap
+import os
+import struct
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from agents import Action, GameState, MCTSAgent, MCTSNode
+from game import BitBoard, Mark
+
+
+_MAGIC = b"TTOB"
+_VERSION = 1
+# Magic, version, board size, number of dimensions, win length, the most
+# moves made in any entry's position, number of entries
+_HEADER = struct.Struct("<4sBBBBBI")
+# Canonical hash, player to move, times visited, total score
+_RECORD = struct.Struct("<QBId")
+DEFAULT_DEPTH = 4
+
+BookKey = Tuple[int, int]
+BookStats = Tuple[int, float]
+
+
+def _get_board_config(state: GameState) -> Tuple[int, int, int]:
+    board = state.board
+    return board.board_size, board.num_dimensions, board.win_length
+
+
+def _get_child_keys(state: GameState, actions: Iterable[Action]) -> Dict[Action, BookKey]:
+    """
+    Get the book key of the position after each action
+    """
+    symmetries = state.get_symmetries()
+    symmetric_hashes = symmetries.get_symmetric_hashes(state.board)
+    return {
+        action: (
+            symmetries.get_canonical_hash_with_mark(symmetric_hashes, action.pos, action.player),
+            state.get_next_player(action.player).value
+        )
+        for action in actions
+    }
+
+
+def get_book_entries(
+        root: MCTSNode,
+        state: GameState,
+        max_depth: int=DEFAULT_DEPTH,
+        min_visits: int=1) -> Dict[BookKey, BookStats]:
+    """
+    Get the stats of every move in the search tree under the root (searched
+    from the given state) up to ``max_depth`` moves deep, skipping moves
+    visited fewer than ``min_visits`` times. Moves leading to the same
+    position up to symmetry have their stats added together.
+    """
+    entries = {}
+    state = state.copy()
+
+    def add_children(node: MCTSNode, depth: int):
+        children = {
+            action: child for action, child in node.children.items()
+            if child.times_visited >= min_visits
+        }
+        for action, key in _get_child_keys(state, children).items():
+            child = children[action]
+            times_visited, total_score = entries.get(key, (0, 0.0))
+            entries[key] = (times_visited + child.times_visited, total_score + child.total_score)
+            if depth + 1 < max_depth:
+                state.apply_action(action)
+                try:
+                    add_children(child, depth + 1)
+                finally:
+                    state.undo_action()
+
+    if max_depth > 0:
+        add_children(root, 0)
+    return entries
+
+
+def _write_records(
+        path: str,
+        board_config: Tuple[int, int, int],
+        max_move_count: int,
+        records: Iterable[Tuple[BookKey, BookStats]]):
+    """
+    Write records (which must already be sorted by key) to a new book file.
+    It's written to a temporary file first and moved into place, so readers
+    never see a half-written book and the path can be one of the inputs.
+    """
+    temp_path = f"{path}.tmp"
+    num_entries = 0
+    with open(temp_path, "wb") as book_file:
+        book_file.write(bytes(_HEADER.size))
+        for (board_hash, player), (times_visited, total_score) in records:
+            book_file.write(_RECORD.pack(board_hash, player, times_visited, total_score))
+            num_entries += 1
+        book_file.seek(0)
+        book_file.write(_HEADER.pack(
+            _MAGIC, _VERSION, *board_config, max_move_count, num_entries))
+    os.replace(temp_path, path)
+
+
+def _sum_records(records: Iterable[Tuple[BookKey, BookStats]]) -> Iterator[Tuple[BookKey, BookStats]]:
+    """
+    Add together the stats of consecutive records with the same key
+    """
+    current_key, current_visits, current_score = None, 0, 0.0
+    for key, (times_visited, total_score) in records:
+        if key != current_key:
+            if current_key is not None:
+                yield current_key, (current_visits, current_score)
+            current_key, current_visits, current_score = key, 0, 0.0
+        current_visits += times_visited
+        current_score += total_score
+    if current_key is not None:
+        yield current_key, (current_visits, current_score)
+
+
+def write_opening_book(
+        path: str,
+        root: MCTSNode,
+        state: GameState,
+        max_depth: int=DEFAULT_DEPTH,
+        min_visits: int=1,
+        merge: bool=True):
+    """
+    Save the top ``max_depth`` levels of a search tree (searched from the
+    given state) as an opening book. If ``merge`` is set and there's already a
+    book at the path, the tree's stats are added to it.
+    """
+    entries = get_book_entries(root, state, max_depth, min_visits)
+    board_config = _get_board_config(state)
+    max_move_count = state.move_count + max_depth if entries else 0
+    with contextlib.ExitStack() as stack:
+        books = []
+        if merge and os.path.exists(path):
+            books.append(stack.enter_context(OpeningBook(path)))
+        for book in books:
+            if book.board_config != board_config:
+                raise ValueError(f"{path} is for a different board")
+            max_move_count = max(max_move_count, book.max_move_count)
+        records = heapq.merge(sorted(entries.items()), *books, key=lambda record: record[0])
+        _write_records(path, board_config, max_move_count, _sum_records(records))
+
+
+def merge_opening_books(output_path: str, input_paths: List[str]):
+    """
+    Combine the given books into one by adding together their stats for each
+    position. The output can be one of the inputs.
+    """
+    with contextlib.ExitStack() as stack:
+        books = [stack.enter_context(OpeningBook(path)) for path in input_paths]
+        if len({book.board_config for book in books}) > 1:
+            raise ValueError("Can't merge opening books for different boards")
+        _write_records(
+            output_path,
+            books[0].board_config,
+            max(book.max_move_count for book in books),
+            _sum_records(heapq.merge(*books, key=lambda record: record[0])))
+
+
+class OpeningBook:
+    """
+    A read-only, memory-mapped opening book written by
+    ``write_opening_book()``. Iterating over it yields its ``(key, stats)``
+    records in order.
+    """
+    def __init__(self, path: str):
+        with open(path, "rb") as book_file:
+            self._data = mmap.mmap(book_file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, board_size, num_dimensions, win_length, self.max_move_count,
+            self._num_entries) = _HEADER.unpack_from(self._data)
+        if magic != _MAGIC or version != _VERSION:
+            self._data.close()
+            raise ValueError(f"{path} isn't a version {_VERSION} opening book")
+        self.board_config = (board_size, num_dimensions, win_length)
+
+    def close(self):
+        self._data.close()
+
+    def __enter__(self) -> "OpeningBook":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self) -> int:
+        return self._num_entries
+
+    def _get_record(self, index: int) -> Tuple[BookKey, BookStats]:
+        board_hash, player, times_visited, total_score = _RECORD.unpack_from(
+            self._data, _HEADER.size + index * _RECORD.size)
+        return (board_hash, player), (times_visited, total_score)
+
+    def __iter__(self) -> Iterator[Tuple[BookKey, BookStats]]:
+        for index in range(self._num_entries):
+            yield self._get_record(index)
+
+    def get(self, key: BookKey) -> BookStats:
+        """
+        Binary search the records for the given key, returning its stats or
+        None if it isn't in the book
+        """
+        low, high = 0, self._num_entries
+        while low < high:
+            middle = (low + high) // 2
+            middle_key, stats = self._get_record(middle)
+            if middle_key == key:
+                return stats
+            if middle_key < key:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def get_priors(self, state: GameState, actions: Iterable[Action]) -> Dict[Action, BookStats]:
+        """
+        Get the book's stats for each of the given actions from the state that
+        it has an entry for
+        """
+        if (_get_board_config(state) != self.board_config
+                or state.move_count >= self.max_move_count):
+            return {}
+        priors = {}
+        for action, key in _get_child_keys(state, actions).items():
+            stats = self.get(key)
+            if stats is not None:
+                priors[action] = stats
+        return priors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or merge tic-tac-toe opening books")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser(
+        "build", help="Search from an empty board and add the tree to a book")
+    build_parser.add_argument("output", help="Path of the book to write or add to")
+    build_parser.add_argument("--iterations", type=int, default=100_000)
+    build_parser.add_argument("--depth", type=int, default=DEFAULT_DEPTH)
+    build_parser.add_argument("--min-visits", type=int, default=1)
+    build_parser.add_argument("--board-size", type=int, default=3)
+    build_parser.add_argument("--dimensions", type=int, default=2)
+    build_parser.add_argument("--win-length", type=int, default=None)
+    merge_parser = subparsers.add_parser("merge", help="Combine several books into one")
+    merge_parser.add_argument("output", help="Path to write the merged book to")
+    merge_parser.add_argument("inputs", nargs="+", help="Books to merge")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        state = GameState(BitBoard(args.board_size, args.dimensions, args.win_length), Mark.X)
+        root = MCTSAgent(use_symmetries=True).search(state, args.iterations)
+        write_opening_book(args.output, root, state, args.depth, args.min_visits)
+    else:
+        merge_opening_books(args.output, args.inputs)
+    with OpeningBook(args.output) as book:
+        print(f"{args.output}: {len(book)} positions")
@@ -0,0 +1,232 @@
+"""
+Rollout (playout) policies for ``MCTSAgent(rollout_policy=...)``, which
+decide how moves are picked when simulating a game from a leaf to the end.
+
+The built-in policies keep a count of each player's marks in every winning
+line as moves are made, so they can spot wins and threats without rescanning
+the board:
+
+- ``"random"``: uniformly random moves (like the default playout).
+- ``"win-block"``: takes an immediate win if there is one, otherwise blocks
+  the opponent's immediate win, otherwise moves randomly. Playouts look much
+  more like real games, so fewer are needed to find the right move.
+
+Either can be given a ``max_moves`` cap, after which the playout stops and the
+position is scored by how many open lines each player has (e.g. the
+``"win-block-capped"`` policy).
+"""
+import functools
+import random
+from typing import Dict, List, Set, Tuple
+
+from agents import Action, GameState, get_playout_scores
+from game import Mark, get_cell_points, get_cell_win_lines, get_win_lines
+
+
+# How many moves the "-capped" policies play before scoring the position
+DEFAULT_MAX_MOVES = 20
+
+
+@functools.lru_cache(maxsize=None)
+def _get_cell_line_ids(board_size: int, num_dimensions: int, win_length: int) -> Tuple[Tuple[int, ...], ...]:
+    """
+    Get the index (in ``get_win_lines()``) of every line through each cell
+    """
+    line_ids = {
+        line: line_id
+        for line_id, line in enumerate(get_win_lines(board_size, num_dimensions, win_length))
+    }
+    return tuple(
+        tuple(line_ids[line] for line in cell_lines)
+        for cell_lines in get_cell_win_lines(board_size, num_dimensions, win_length)
+    )
+
+
+class RolloutPolicy:
+    """
+    The interface for rollout policies.
+    """
+    def playout(
+            self,
+            state: GameState,
+            player: Mark,
+            trace: List[Action]=None,
+            rng: random.Random=None) -> Tuple[Dict[Mark, float], int]:
+        """
+        Simulate the rest of the game from the state (leaving it unchanged)
+        and return each player's score (see ``agents.get_playout_scores()``),
+        along with how many moves were made. If a ``trace`` list is given, the
+        moves made are added to it. Random choices are drawn from ``rng`` (the
+        agent's generator), or a fresh unseeded one if it isn't given.
+        """
+        raise NotImplementedError
+
+
+class _LineCounts:
+    """
+    The cells of a board and each player's mark counts in every winning line,
+    updated as a playout makes moves
+    """
+    def __init__(self, state: GameState):
+        board = state.board
+        self.get_next_player = state.get_next_player
+        self.win_length = board.win_length
+        self.lines = get_win_lines(board.board_size, board.num_dimensions, board.win_length)
+        self.cell_lines = _get_cell_line_ids(board.board_size, board.num_dimensions, board.win_length)
+        self.cell_points = get_cell_points(board.board_size, board.num_dimensions)
+        self.marks = [board.get_mark(point) for point in self.cell_points]
+        self.empty_cells = [index for index, mark in enumerate(self.marks) if mark == Mark.BLANK]
+        self.counts = {Mark.X: [0] * len(self.lines), Mark.O: [0] * len(self.lines)}
+        for index, mark in enumerate(self.marks):
+            if mark != Mark.BLANK:
+                for line_id in self.cell_lines[index]:
+                    self.counts[mark][line_id] += 1
+        # The lines each player can complete with one more move
+        self.threats: Dict[Mark, Set[int]] = {
+            mark: {
+                line_id for line_id in range(len(self.lines))
+                if counts[line_id] == self.win_length - 1
+                and self.counts[state.get_next_player(mark)][line_id] == 0
+            }
+            for mark, counts in self.counts.items()
+        }
+
+    def get_empty_cell(self, line_id: int) -> int:
+        return next(index for index in self.lines[line_id] if self.marks[index] == Mark.BLANK)
+
+    def place(self, empty_index: int, mark: Mark) -> bool:
+        """
+        Mark the cell at the given position in ``empty_cells``, returning
+        whether that won the game
+        """
+        empty_cells = self.empty_cells
+        cell = empty_cells[empty_index]
+        # Swap with the last empty cell so removing it is constant time
+        empty_cells[empty_index] = empty_cells[-1]
+        empty_cells.pop()
+        self.marks[cell] = mark
+        counts = self.counts[mark]
+        opponent = self.get_next_player(mark)
+        opponent_counts = self.counts[opponent]
+        won = False
+        for line_id in self.cell_lines[cell]:
+            counts[line_id] += 1
+            if counts[line_id] == self.win_length:
+                won = True
+            elif counts[line_id] == self.win_length - 1 and opponent_counts[line_id] == 0:
+                self.threats[mark].add(line_id)
+            self.threats[opponent].discard(line_id)
+        return won
+
+    def get_open_line_score(self, mark: Mark) -> int:
+        """
+        Score how many lines the player could still complete, weighting lines
+        they've already got more marks in more heavily
+        """
+        counts = self.counts[mark]
+        opponent_counts = self.counts[self.get_next_player(mark)]
+        return sum(
+            count * count
+            for count, opponent_count in zip(counts, opponent_counts)
+            if count and not opponent_count
+        )
+
+
+class RandomRollout(RolloutPolicy):
+    """
+    Plays uniformly random moves. If ``max_moves`` is given, a playout that
+    hasn't finished after that many moves is scored by ``_evaluate_cutoff()``
+    instead of being played out.
+    """
+    def __init__(self, max_moves: int=None):
+        self.max_moves = max_moves
+
+    def _choose_move(self, lines: _LineCounts, mover: Mark, rng: random.Random) -> int:
+        """
+        Get the position in ``lines.empty_cells`` of the cell to play
+        """
+        return rng.randrange(len(lines.empty_cells))
+
+    def playout(
+            self,
+            state: GameState,
+            player: Mark,
+            trace: List[Action]=None,
+            rng: random.Random=None) -> Tuple[Dict[Mark, float], int]:
+        if rng is None:
+            rng = random.Random()
+        if state.is_terminal():
+            return get_playout_scores(
+                state, player, float(state.winner == player), float(state.winner is None)), 0
+
+        lines = _LineCounts(state)
+        mover = state.player
+        num_moves = 0
+        while lines.empty_cells:
+            if self.max_moves is not None and num_moves >= self.max_moves:
+                win_rate, draw_rate = self._evaluate_cutoff(lines, mover, player)
+                return get_playout_scores(state, player, win_rate, draw_rate), num_moves
+            cell_index = self._choose_move(lines, mover, rng)
+            if trace is not None:
+                trace.append(Action(lines.cell_points[lines.empty_cells[cell_index]], mover))
+            num_moves += 1
+            if lines.place(cell_index, mover):
+                return get_playout_scores(state, player, float(mover == player), 0.0), num_moves
+            mover = state.get_next_player(mover)
+        return get_playout_scores(state, player, 0.0, 1.0), num_moves
+
+    def _evaluate_cutoff(self, lines: _LineCounts, mover: Mark, player: Mark) -> Tuple[float, float]:
+        """
+        Estimate the player's win and draw rates from an unfinished position
+        with the given player to move
+        """
+        opponent = lines.get_next_player(mover)
+        winner = None
+        if lines.threats[mover]:
+            winner = mover
+        elif len({lines.get_empty_cell(line_id) for line_id in lines.threats[opponent]}) > 1:
+            # The mover can only block one of the opponent's winning moves
+            winner = opponent
+        if winner is not None:
+            return float(winner == player), 0.0
+
+        player_score = lines.get_open_line_score(player)
+        total_score = player_score + lines.get_open_line_score(lines.get_next_player(player))
+        if total_score == 0:
+            # Nobody can win any more
+            return 0.0, 1.0
+        return player_score / total_score, 0.0
+
+
+class WinBlockRollout(RandomRollout):
+    """
+    Takes an immediate win if there is one, otherwise blocks the opponent's
+    immediate win if there is one, otherwise moves randomly.
+    """
+    def _choose_move(self, lines: _LineCounts, mover: Mark, rng: random.Random) -> int:
+        for mark in (mover, lines.get_next_player(mover)):
+            threats = lines.threats[mark]
+            if threats:
+                cell = lines.get_empty_cell(next(iter(threats)))
+                return lines.empty_cells.index(cell)
+        return rng.randrange(len(lines.empty_cells))
+
+
+ROLLOUT_POLICIES = {
+    "random": RandomRollout,
+    "random-capped": functools.partial(RandomRollout, max_moves=DEFAULT_MAX_MOVES),
+    "win-block": WinBlockRollout,
+    "win-block-capped": functools.partial(WinBlockRollout, max_moves=DEFAULT_MAX_MOVES),
+}
+
+
+def get_rollout_policy(policy) -> RolloutPolicy:
+    """
+    Get a rollout policy by name (see ``ROLLOUT_POLICIES``), or return the
+    given policy if it already is one
+    """
+    if isinstance(policy, RolloutPolicy):
+        return policy
+    if policy not in ROLLOUT_POLICIES:
+        raise ValueError(f"Unknown rollout policy: {policy}")
+    return ROLLOUT_POLICIES[policy]()
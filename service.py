@@ -0,0 +1,343 @@
+"""
+An asyncio service for picking moves in many concurrent games, running the
+searches in a shared process pool.
+
+It can also be run as a local server that reads one JSON request per line
+from stdin (or a TCP port with ``--port``) and writes a JSON response per line
+as each search finishes:
+
+    python service.py --workers 4 --max-concurrent 8
+
+    {"id": 1, "game": "a", "board": "X...O....", "player": "X", "iterations": 1000}
+    {"id": 2, "game": "b", "board": ".........", "player": "X", "time_limit": 0.5}
+    {"cancel": "a"}
+
+Boards use the ``game.encode_board()`` format (with optional ``dimensions``
+and ``win_length`` fields), and responses look like
+``{"id": 1, "move": [2, 2], "iterations": 1000, "elapsed": 0.2, "stop_reason": "iterations"}``
+or ``{"id": 1, "error": "cancelled"}``.
+"""
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import dataclasses
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import sys
+from typing import Deque, Dict, Hashable, List
+
+from agents import GameState, MCTSAgent, SearchBudget, SearchResult, StopReason
+from game import Mark, decode_board
+
+
+# Which request slots have been cancelled, shared with the worker processes
+_cancel_flags = None
+
+
+class SearchCancelled(Exception):
+    pass
+
+
+def _init_worker(cancel_flags):
+    global _cancel_flags
+    _cancel_flags = cancel_flags
+
+
+def _run_search(agent_options: dict, state: GameState, budget: SearchBudget, slot: int, seed: int) -> SearchResult:
+    # Stop as soon as the request's slot is flagged as cancelled
+    budget = dataclasses.replace(budget, should_stop=lambda: _cancel_flags[slot])
+    with MCTSAgent(seed=seed, **agent_options) as agent:
+        result = agent.get_move_with_budget(state, budget)
+    if result.stop_reason == StopReason.STOPPED:
+        raise SearchCancelled()
+    return result
+
+
+@dataclasses.dataclass
+class _Request:
+    game_id: Hashable
+    state: GameState
+    budget: SearchBudget
+    future: asyncio.Future
+    slot: int=None
+
+
+class AgentService:
+    """
+    Picks moves for many games at once with ``await get_move_async()``.
+
+    Searches run in a process pool of ``num_workers`` shared by every game,
+    with at most ``max_concurrent`` running at a time (the rest wait in
+    per-game queues). Whenever one finishes, the next search comes from the
+    waiting game that was served longest ago, so a game making lots of
+    requests can't starve the others. ``cancel_game()`` drops a game's waiting
+    requests and stops its running searches.
+
+    ``agent_options`` are passed to the ``MCTSAgent`` created for each search
+    (which can't use parallel search itself). Each search is seeded from a
+    generator seeded with ``seed``, if given.
+    """
+    def __init__(
+            self,
+            agent_options: dict=None,
+            num_workers: int=None,
+            max_concurrent: int=None,
+            seed: int=None):
+        self.agent_options = dict(agent_options or {})
+        self._rng = random.Random(seed)
+        if self.agent_options.get("num_workers", 1) > 1:
+            raise ValueError("Service searches already run in parallel")
+        num_workers = num_workers or os.cpu_count() or 1
+        self.max_concurrent = max_concurrent or num_workers
+        self._cancel_flags = multiprocessing.RawArray("b", self.max_concurrent)
+        self._executor = concurrent.futures.ProcessPoolExecutor(
+            num_workers, initializer=_init_worker, initargs=(self._cancel_flags,))
+        self._free_slots = list(range(self.max_concurrent))
+        self._waiting: Dict[Hashable, Deque[_Request]] = {}
+        self._running: Dict[Hashable, List[_Request]] = collections.defaultdict(list)
+        self._last_served: Dict[Hashable, int] = {}
+        self._dispatch_count = itertools.count()
+
+    @property
+    def num_running(self) -> int:
+        return self.max_concurrent - len(self._free_slots)
+
+    @property
+    def num_waiting(self) -> int:
+        return sum(len(requests) for requests in self._waiting.values())
+
+    async def get_move_async(self, state: GameState, budget: SearchBudget, game_id: Hashable=None) -> SearchResult:
+        """
+        Search for the move to play without blocking the event loop. Raises
+        ``asyncio.CancelledError`` if the game is cancelled first.
+        """
+        request = _Request(game_id, state.copy(), budget, asyncio.get_running_loop().create_future())
+        self._waiting.setdefault(game_id, collections.deque()).append(request)
+        self._dispatch()
+        try:
+            return await request.future
+        except asyncio.CancelledError:
+            # Also stop the search if the caller's task was cancelled
+            self._cancel_request(request)
+            raise
+
+    def cancel_game(self, game_id: Hashable):
+        """
+        Cancel all of a game's waiting and running searches (e.g. because
+        the game ended)
+        """
+        for request in self._waiting.pop(game_id, []):
+            request.future.cancel()
+        for request in self._running.get(game_id, []):
+            self._cancel_request(request)
+        self._forget_game(game_id)
+
+    def _cancel_request(self, request: _Request):
+        request.future.cancel()
+        if request.slot is not None:
+            self._cancel_flags[request.slot] = 1
+        else:
+            waiting = self._waiting.get(request.game_id)
+            if waiting and request in waiting:
+                waiting.remove(request)
+                if not waiting:
+                    del self._waiting[request.game_id]
+
+    def _forget_game(self, game_id: Hashable):
+        if game_id not in self._waiting and not self._running.get(game_id):
+            self._running.pop(game_id, None)
+            self._last_served.pop(game_id, None)
+
+    def _dispatch(self):
+        """
+        Start waiting searches while there are free slots, fairly across games
+        """
+        while self._free_slots and self._waiting:
+            game_id = min(self._waiting, key=lambda game_id: self._last_served.get(game_id, -1))
+            waiting = self._waiting[game_id]
+            request = waiting.popleft()
+            if not waiting:
+                del self._waiting[game_id]
+            if request.future.done():
+                continue
+            self._last_served[game_id] = next(self._dispatch_count)
+            request.slot = self._free_slots.pop()
+            self._cancel_flags[request.slot] = 0
+            self._running[game_id].append(request)
+            future = self._executor.submit(
+                _run_search, self.agent_options, request.state, request.budget,
+                request.slot, self._rng.getrandbits(64))
+            asyncio.wrap_future(future).add_done_callback(
+                lambda search, request=request: self._finish(request, search))
+
+    def _finish(self, request: _Request, search: asyncio.Future):
+        self._free_slots.append(request.slot)
+        self._running[request.game_id].remove(request)
+        self._forget_game(request.game_id)
+        if not request.future.done():
+            if search.cancelled():
+                request.future.cancel()
+            elif isinstance(search.exception(), SearchCancelled):
+                request.future.cancel()
+            elif search.exception() is not None:
+                request.future.set_exception(search.exception())
+            else:
+                request.future.set_result(search.result())
+        elif not search.cancelled():
+            # Nobody's waiting for it, but retrieve the result anyway so
+            # asyncio doesn't warn that its exception was never retrieved
+            search.exception()
+        self._dispatch()
+
+    def close(self):
+        for game_id in list(self._waiting) + list(self._running):
+            self.cancel_game(game_id)
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    async def __aenter__(self) -> "AgentService":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+
+def _parse_player(message: dict) -> Mark:
+    player = message.get("player", "X")
+    if not isinstance(player, str) or player.upper() not in ("X", "O"):
+        raise ValueError(f"player must be X or O, got {player!r}")
+    return Mark[player.upper()]
+
+
+def _parse_budget(message: dict) -> SearchBudget:
+    limits = {}
+    for name, limit_type in [
+            ("iterations", int), ("time_limit", (int, float)), ("max_nodes", int), ("max_memory_bytes", int)]:
+        limit = message.get(name)
+        if limit is None:
+            continue
+        # bool is a subclass of int, but true isn't a valid limit
+        if isinstance(limit, bool) or not isinstance(limit, limit_type) or limit <= 0:
+            raise ValueError(f"{name} must be a positive number, got {limit!r}")
+        limits[name] = limit
+    if not limits:
+        limits["iterations"] = 1000
+    early_stop = message.get("early_stop", True)
+    if not isinstance(early_stop, bool):
+        raise ValueError(f"early_stop must be true or false, got {early_stop!r}")
+    return SearchBudget(**limits, early_stop=early_stop)
+
+
+async def handle_message(service: AgentService, message: dict) -> dict:
+    """
+    Handle one request from the JSON front end, returning the response (or
+    None for cancellations, which don't get one)
+    """
+    if not isinstance(message, dict):
+        return {"id": None, "error": "invalid request: expected a JSON object"}
+    if "cancel" in message:
+        service.cancel_game(message["cancel"])
+        return None
+    response = {"id": message.get("id")}
+    try:
+        board = decode_board(message["board"], message.get("dimensions", 2), message.get("win_length"))
+        state = GameState(board, _parse_player(message))
+        if state.is_terminal():
+            raise ValueError("The game is already over")
+        result = await service.get_move_async(state, _parse_budget(message), message.get("game"))
+    except asyncio.CancelledError:
+        response["error"] = "cancelled"
+    except (KeyError, ValueError) as error:
+        response["error"] = f"invalid request: {error}"
+    except Exception as error:
+        # Anything else still gets a reply, rather than escaping the task
+        response["error"] = f"request failed: {error!r}"
+    else:
+        response.update(
+            move=list(result.action.pos.coords),
+            iterations=result.iterations,
+            elapsed=result.elapsed,
+            stop_reason=result.stop_reason.value,
+        )
+    return response
+
+
+async def _serve_lines(service: AgentService, read_line, write_line):
+    """
+    Handle each JSON line read concurrently, writing responses as they finish
+    """
+    tasks = set()
+
+    async def respond(line: str):
+        try:
+            response = await handle_message(service, json.loads(line))
+        except json.JSONDecodeError as error:
+            response = {"error": f"invalid JSON: {error}"}
+        if response is not None:
+            await write_line(json.dumps(response))
+
+    while True:
+        line = await read_line()
+        if not line:
+            break
+        if line.strip():
+            task = asyncio.create_task(respond(line))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.wait(tasks)
+
+
+async def serve_stdio(service: AgentService):
+    loop = asyncio.get_running_loop()
+
+    async def read_line() -> str:
+        return await loop.run_in_executor(None, sys.stdin.readline)
+
+    async def write_line(line: str):
+        print(line, flush=True)
+
+    await _serve_lines(service, read_line, write_line)
+
+
+async def serve_tcp(service: AgentService, host: str, port: int):
+    async def handle_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        async def read_line() -> str:
+            return (await reader.readline()).decode()
+
+        async def write_line(line: str):
+            writer.write(line.encode() + b"\n")
+            await writer.drain()
+
+        try:
+            await _serve_lines(service, read_line, write_line)
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle_connection, host, port)
+    async with server:
+        await server.serve_forever()
+
+
+async def _main(args: argparse.Namespace):
+    agent_options = json.loads(args.agent_options) if args.agent_options else {}
+    async with AgentService(agent_options, args.workers, args.max_concurrent, args.seed) as service:
+        if args.port is None:
+            await serve_stdio(service)
+        else:
+            await serve_tcp(service, args.host, args.port)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: one per CPU)")
+    parser.add_argument("--max-concurrent", type=int, default=None,
+                        help="Most searches to run at once (default: one per worker)")
+    parser.add_argument("--agent-options", help='MCTSAgent options as JSON, e.g. \'{"use_solver": true}\'')
+    parser.add_argument("--seed", type=int, default=None, help="Seed for reproducible searches")
+    parser.add_argument("--port", type=int, default=None, help="Serve over TCP instead of stdin/stdout")
+    parser.add_argument("--host", default="127.0.0.1")
+    asyncio.run(_main(parser.parse_args()))
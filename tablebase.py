@@ -0,0 +1,240 @@
+"""
+A precomputed table of the perfect-play result of every reachable position on
+small boards, stored in a compact binary file that's memory-mapped for lookups.
+
+Build one with:
+
+    python tablebase.py ttt3.tb --board-size 3
+
+Positions are indexed by their rank (the board read as a base-3 number), so a
+lookup is a single read from the mapped file, and only the pages actually
+read are loaded into memory no matter how large the table is. Tables assume X
+moves first, like ``play.py``.
+"""
+import argparse
+import enum
+import mmap
+import struct
+from typing import Dict, List, Tuple
+
+from agents import Action, GameState, get_playout_scores
+from game import BitBoard, Mark, get_cell_points
+
+
+_MAGIC = b"TTTB"
+_VERSION = 1
+# Magic, version, board size, number of dimensions, win length
+_HEADER = struct.Struct("<4sBBBB")
+_MARK_DIGITS = {Mark.BLANK: 0, Mark.X: 1, Mark.O: 2}
+# The table has an entry for every possible board, so bigger boards than this
+# (a 4x4 table is 43MB) aren't practical
+MAX_CELLS = 16
+
+
+class Outcome(enum.IntEnum):
+    """
+    The result of a position with perfect play, for the player to move
+    """
+    UNKNOWN=0
+    LOSS=1
+    DRAW=2
+    WIN=3
+
+
+def _get_opposite_outcome(outcome: Outcome) -> Outcome:
+    if outcome == Outcome.WIN:
+        return Outcome.LOSS
+    if outcome == Outcome.LOSS:
+        return Outcome.WIN
+    return outcome
+
+
+def _encode(outcome: Outcome, plies: int) -> int:
+    # The outcome goes in the low 2 bits and the number of moves left until
+    # the game ends (with perfect play) in the other 6
+    return outcome | (plies << 2)
+
+
+def _decode(entry: int) -> Tuple[Outcome, int]:
+    return Outcome(entry & 0b11), entry >> 2
+
+
+def _get_symmetric_ranks(state: GameState) -> List[int]:
+    """
+    Get the rank of each rotation/reflection of the board, in the same order
+    as its ``BoardSymmetries.permutations``
+    """
+    board = state.board
+    digits = [
+        _MARK_DIGITS[board.get_mark(point)]
+        for point in get_cell_points(board.board_size, board.num_dimensions)
+    ]
+    ranks = []
+    for permutation in state.get_symmetries().permutations:
+        rank = 0
+        for index, digit in enumerate(digits):
+            if digit:
+                rank += digit * 3 ** permutation[index]
+        ranks.append(rank)
+    return ranks
+
+
+def build_tablebase(
+        path: str,
+        board_size: int=3,
+        num_dimensions: int=2,
+        win_length: int=None) -> int:
+    """
+    Solves every position reachable from an empty board (searching only one
+    of each group of symmetric positions) and writes the table to the given
+    path. Returns the number of distinct positions solved.
+    """
+    if win_length is None:
+        win_length = board_size
+    num_cells = board_size ** num_dimensions
+    if num_cells > MAX_CELLS:
+        raise ValueError(f"Tablebases only support boards with up to {MAX_CELLS} cells")
+    table = bytearray(3 ** num_cells)
+    solved: Dict[int, Tuple[Outcome, int]] = {}
+    state = GameState(BitBoard(board_size, num_dimensions, win_length), Mark.X)
+
+    def solve() -> Tuple[Outcome, int]:
+        symmetric_ranks = _get_symmetric_ranks(state)
+        canonical_rank = min(symmetric_ranks)
+        if canonical_rank in solved:
+            return solved[canonical_rank]
+
+        if state.is_terminal():
+            # The player to move has either lost or drawn
+            result = (Outcome.LOSS if state.winner else Outcome.DRAW, 0)
+        else:
+            results = []
+            for action in state.get_unique_actions():
+                state.apply_action(action)
+                try:
+                    reply_outcome, reply_plies = solve()
+                finally:
+                    state.undo_action()
+                results.append((_get_opposite_outcome(reply_outcome), reply_plies + 1))
+            # Win as quickly, and lose as slowly, as possible
+            result = max(
+                results,
+                key=lambda result: (result[0], -result[1] if result[0] == Outcome.WIN else result[1]))
+
+        solved[canonical_rank] = result
+        for rank in symmetric_ranks:
+            table[rank] = _encode(*result)
+        return result
+
+    solve()
+    with open(path, "wb") as table_file:
+        table_file.write(_HEADER.pack(_MAGIC, _VERSION, board_size, num_dimensions, win_length))
+        table_file.write(table)
+    return len(solved)
+
+
+class Tablebase:
+    """
+    A read-only, memory-mapped tablebase built by ``build_tablebase()``.
+    """
+    def __init__(self, path: str):
+        with open(path, "rb") as table_file:
+            self._table = mmap.mmap(table_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.board_size, self.num_dimensions, self.win_length = \
+            _HEADER.unpack_from(self._table)
+        if magic != _MAGIC or version != _VERSION:
+            self._table.close()
+            raise ValueError(f"{path} isn't a version {_VERSION} tablebase")
+
+    def close(self):
+        self._table.close()
+
+    def __enter__(self) -> "Tablebase":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def probe(self, state: GameState) -> Tuple[Outcome, int]:
+        """
+        Get the perfect-play outcome for the player to move and the number of
+        moves left until the game ends, or None if the position isn't in the
+        table (e.g. a different board, or not reachable with X moving first).
+        """
+        board = state.board
+        if (board.board_size, board.num_dimensions, board.win_length) != (
+                self.board_size, self.num_dimensions, self.win_length):
+            return None
+        rank = 0
+        num_x = num_o = 0
+        for index, point in enumerate(get_cell_points(board.board_size, board.num_dimensions)):
+            mark = board.get_mark(point)
+            if mark == Mark.X:
+                num_x += 1
+            elif mark == Mark.O:
+                num_o += 1
+            rank += _MARK_DIGITS[mark] * 3 ** index
+        if state.player != (Mark.X if num_x == num_o else Mark.O):
+            return None
+        outcome, plies = _decode(self._table[_HEADER.size + rank])
+        if outcome == Outcome.UNKNOWN:
+            return None
+        return outcome, plies
+
+    def get_scores(self, state: GameState, player: Mark) -> Dict[Mark, float]:
+        """
+        Get the perfect-play result of the position as playout scores, or None
+        if it isn't in the table.
+        """
+        result = self.probe(state)
+        if result is None:
+            return None
+        outcome, _ = result
+        if player != state.player:
+            outcome = _get_opposite_outcome(outcome)
+        return get_playout_scores(
+            state, player, float(outcome == Outcome.WIN), float(outcome == Outcome.DRAW))
+
+
+class TablebaseAgent:
+    """
+    Plays perfectly by looking up the result of every available move in a
+    tablebase: winning as fast as possible, and otherwise drawing or losing as
+    slowly as possible.
+    """
+    def __init__(self, path: str):
+        self.tablebase = Tablebase(path)
+
+    def close(self):
+        self.tablebase.close()
+
+    def __enter__(self) -> "TablebaseAgent":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def get_move(self, state: GameState) -> Action:
+        best_action, best_key = None, None
+        for action in state.get_actions():
+            reply = self.tablebase.probe(state.get_next_state(action))
+            if reply is None:
+                raise ValueError("Position isn't in the tablebase")
+            reply_outcome, reply_plies = reply
+            # The opponent losing after this move is best for us
+            key = (-reply_outcome, -reply_plies if reply_outcome == Outcome.LOSS else reply_plies)
+            if best_key is None or key > best_key:
+                best_action, best_key = action, key
+        return best_action
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a tic-tac-toe tablebase")
+    parser.add_argument("output", help="Path to write the table to")
+    parser.add_argument("--board-size", type=int, default=3)
+    parser.add_argument("--dimensions", type=int, default=2)
+    parser.add_argument("--win-length", type=int, default=None)
+    args = parser.parse_args()
+    num_positions = build_tablebase(
+        args.output, args.board_size, args.dimensions, args.win_length)
+    print(f"Solved {num_positions} positions")
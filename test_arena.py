@@ -0,0 +1,71 @@
+import pytest
+
+from agents import MCTSAgent, RandomAIAgent
+from arena import (
+    ArenaStats, GameResult, PlayerConfig, parse_player, percentile, play_game,
+    run_arena, wilson_interval)
+
+
+def test_parse_player():
+    player = parse_player("mcts:iterations=50,use_symmetries=true,transposition_table_size=100")
+    assert player.agent_type is MCTSAgent
+    assert player.iterations == 50
+    assert dict(player.options) == {"use_symmetries": True, "transposition_table_size": 100}
+    assert parse_player("random", "B") == PlayerConfig("B", RandomAIAgent)
+    with pytest.raises(ValueError):
+        parse_player("alphazero")
+
+
+def test_games_are_repeatable():
+    first = PlayerConfig("first", RandomAIAgent)
+    second = PlayerConfig("second", RandomAIAgent)
+    results = [play_game(first, second, seed=1234) for _ in range(2)]
+    assert results[0].winner == results[1].winner
+    assert len(results[0].move_times["first"]) >= len(results[0].move_times["second"])
+
+
+def test_mcts_ai_beats_random_ai():
+    mcts = PlayerConfig("mcts", MCTSAgent, iterations=300)
+    random_player = PlayerConfig("random", RandomAIAgent)
+    results = list(run_arena(mcts, random_player, num_games=10))
+    _, stats = results[-1]
+    assert stats.num_games == 10
+    assert [result.game_index for result, _ in results] == list(range(10))
+    # Players swap sides each game
+    assert {result.x_player for result, _ in results} == {"mcts", "random"}
+    assert stats.losses == 0
+    assert stats.wins > stats.draws
+    assert stats.iterations["mcts"] > 0
+    assert stats.iterations_per_second("random") == 0.0
+
+
+def test_parallel_arena_plays_every_game():
+    first = PlayerConfig("first", RandomAIAgent)
+    second = PlayerConfig("second", RandomAIAgent)
+    results = list(run_arena(first, second, num_games=6, num_workers=2, seed=7))
+    assert sorted(result.game_index for result, _ in results) == list(range(6))
+    # The same seed plays the same games in a single process
+    serial_results = {
+        result.game_index: result.winner for result, _ in run_arena(first, second, num_games=6, seed=7)}
+    assert {result.game_index: result.winner for result, _ in results} == serial_results
+
+
+def test_arena_stats():
+    stats = ArenaStats("a", "b")
+    for winner in ["a", "a", None, "b"]:
+        stats.add(GameResult(0, 0, "a", "b", winner, {"a": [0.1], "b": [0.3]}, {"a": 10, "b": 0}))
+    assert (stats.wins, stats.draws, stats.losses) == (2, 1, 1)
+    mean, margin = stats.score()
+    assert mean == pytest.approx(0.625)
+    assert 0 < margin < 0.625
+    assert stats.iterations_per_second("a") == pytest.approx(100)
+    assert "4 games" in stats.summary()
+
+
+def test_wilson_interval_and_percentile():
+    low, high = wilson_interval(50, 100)
+    assert low < 0.5 < high
+    assert wilson_interval(0, 10)[0] == 0.0
+    assert wilson_interval(10, 10)[1] == 1.0
+    assert percentile([3, 1, 2, 4], 0.5) == 2
+    assert percentile([3, 1, 2, 4], 0.99) == 4
@@ -0,0 +1,82 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+from agents import Action, GameState, MCTSAgent
+from batch_playout import BatchPlayouts
+from game import BitBoard, Board, Mark, Point
+
+
+def test_batch_playout_forced_win():
+    """
+    ======
+    X|X|
+    O|O|X
+    O|X|O
+    ======
+    X to move can only play the winning move
+    """
+    board = Board()
+    for pos in [Point(0,0), Point(0,1), Point(1,2), Point(2,1)]:
+        board.set_mark(pos, Mark.X)
+    for pos in [Point(1,0), Point(1,1), Point(2,0), Point(2,2)]:
+        board.set_mark(pos, Mark.O)
+    state = GameState(board, player=Mark.X)
+
+    scores = BatchPlayouts(batch_size=16).playout(state, Mark.X)
+    assert scores == {Mark.X: 1.0, Mark.O: -1.0}
+    assert BatchPlayouts(batch_size=16).playout(state, Mark.O) == {Mark.X: 0.0, Mark.O: 0.0}
+
+
+def _exact_random_play_score(state: GameState, player: Mark, wins_only: bool=False) -> float:
+    if state.is_terminal():
+        return float(state.winner == player) if wins_only else state.get_score(player)
+    actions = state.get_actions()
+    return sum(
+        _exact_random_play_score(state.get_next_state(action), player, wins_only)
+        for action in actions
+    ) / len(actions)
+
+
+def test_batch_playout_stops_at_first_win():
+    """
+    ======
+    X|X|
+    O|O|
+     | |
+    ======
+    X to move; both players have a line to finish, but only the first one
+    finished counts
+    """
+    board = BitBoard()
+    board.set_mark(Point(0,0), Mark.X)
+    board.set_mark(Point(0,1), Mark.X)
+    board.set_mark(Point(1,0), Mark.O)
+    board.set_mark(Point(1,1), Mark.O)
+    state = GameState(board, player=Mark.X)
+
+    scores = BatchPlayouts(batch_size=20_000, seed=0).playout(state, Mark.O)
+    assert scores[Mark.O] == pytest.approx(
+        _exact_random_play_score(state, Mark.O), abs=0.02)
+    assert scores[Mark.X] == pytest.approx(
+        -_exact_random_play_score(state, Mark.O, wins_only=True), abs=0.02)
+
+
+def test_batch_playout_matches_random_play_statistics():
+    state = GameState(BitBoard(), player=Mark.X)
+    scores = BatchPlayouts(batch_size=20_000, seed=0).playout(state, Mark.X)
+    # Random play from an empty board: X wins ~58.5%, O ~28.8%, draws ~12.7%
+    assert scores[Mark.O] == pytest.approx(-0.585, abs=0.02)
+    assert scores[Mark.X] == pytest.approx(0.585 + 0.5 * 0.127, abs=0.02)
+
+
+def test_mcts_ai_with_batched_playouts_finds_win(win_state: GameState):
+    ai = MCTSAgent(playout_batch_size=64)
+    assert ai.get_move(win_state, iterations=200) == Action(Point(0,1), player=Mark.O)
+
+
+def test_batched_playouts_follow_agent_seed():
+    state = GameState(BitBoard(), Mark.X)
+    roots = [MCTSAgent(playout_batch_size=8, seed=3).search(state, 100) for _ in range(2)]
+    assert [(child.times_visited, child.total_score) for child in roots[0].children.values()] == [
+        (child.times_visited, child.total_score) for child in roots[1].children.values()]
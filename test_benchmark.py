@@ -0,0 +1,28 @@
+from benchmark import compare_to_baseline, get_environment, get_suite_benchmarks, time_benchmark
+
+
+def _suite_results(medians: dict) -> dict:
+    return {"results": {name: {"median": median} for name, median in medians.items()}}
+
+
+def test_compare_to_baseline():
+    baseline = _suite_results({"fast": 1.0, "slow": 1.0, "removed": 1.0})
+    current = _suite_results({"fast": 0.5, "slow": 1.5, "added": 9.0})
+    regressions = compare_to_baseline(current, baseline, threshold=0.2)
+    assert [regression["name"] for regression in regressions] == ["slow"]
+    assert regressions[0]["ratio"] == 1.5
+    assert compare_to_baseline(current, baseline, threshold=0.6) == []
+
+
+def test_time_benchmark():
+    result = time_benchmark(lambda: sum(range(100)), repeats=3, min_time=0.001)
+    assert result["repeats"] == 3
+    assert 0 < result["min"] <= result["median"]
+
+
+def test_suite_benchmarks_run():
+    benchmarks = get_suite_benchmarks(board_sizes=(3,), iteration_counts=(5,))
+    assert "get_move/BitBoard-3/5-iterations" in benchmarks
+    for benchmark in benchmarks.values():
+        benchmark()
+    assert "commit" in get_environment()
@@ -0,0 +1,52 @@
+import pytest
+
+from evaluate import PositionEvaluator, evaluate_positions, parse_position
+from game import Mark, Point
+
+
+def test_parse_position():
+    assert parse_position("X...O....").player == Mark.X
+    assert parse_position("X........").player == Mark.O
+    state = parse_position("X........ x")
+    assert state.player == Mark.X
+    assert state.board.get_mark(Point(0,0)) == Mark.X
+
+
+@pytest.mark.parametrize("num_workers", [1, 2])
+def test_evaluations_are_in_input_order(num_workers: int):
+    positions = [
+        "XX.OO....",    # X wins at (0,2)
+        "XX.OO.... O",  # O wins at (1,2)
+        "XXXOO....",    # Already over
+        "..X.OO.XX",    # O wins at (1,0)
+    ]
+    evaluations = list(evaluate_positions(positions, iterations=500, num_workers=num_workers))
+    assert [evaluation.position for evaluation in evaluations] == positions
+    assert [evaluation.move for evaluation in evaluations] == [
+        Point(0,2), Point(1,2), None, Point(1,0)]
+    assert [evaluation.proven_score for evaluation in evaluations[:3]] == [1.0, 1.0, 0.0]
+    assert evaluations[0].to_dict()["move"] == [0, 2]
+
+
+def test_symmetric_positions_are_evaluated_once():
+    with PositionEvaluator(iterations=200, max_pending=2) as evaluator:
+        # The same threat in each corner of the board
+        corners = ["XX.OO....", ".OX.OX...", "....OO.XX", "...XO.XO."]
+        evaluations = list(evaluator.evaluate(corners))
+        assert [evaluation.cached for evaluation in evaluations] == [False, True, True, True]
+        assert [evaluation.move for evaluation in evaluations] == [
+            Point(0,2), Point(2,2), Point(2,0), Point(0,0)]
+        assert len({evaluation.value for evaluation in evaluations}) == 1
+
+        # The cache is kept for later calls
+        again, = evaluator.evaluate(["XX.OO...."])
+        assert again.cached
+
+
+def test_cache_is_bounded():
+    positions = ["X........", ".X.......", "....X....", "X........"]
+    with PositionEvaluator(iterations=20, cache_size=2, max_pending=1) as evaluator:
+        evaluations = list(evaluator.evaluate(positions))
+        assert len(evaluator._cache) == 2
+    # The first position was evicted by the time it came up again
+    assert not evaluations[-1].cached
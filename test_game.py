@@ -1,12 +1,18 @@
-import pytest
-
-from game import Board, Mark, Point
-from agents import Action, GameState, MCTSAgent
+import copy
+import os
+import random
+import subprocess
+import sys
 
+import pytest
 
-@pytest.fixture
-def board() -> Board:
-    return Board()
+from game import (
+    BitBoard, Board, Mark, Point, decode_board, encode_board, get_board_symmetries,
+    get_cell_points, get_win_lines)
+from agents import (
+    Action, GameState, MCTSAgent, MCTSNode, RandomAIAgent, SearchBudget, SearchHooks,
+    SearchRecorder, StopReason, count_nodes, get_playout_scores)
+from array_tree import ROOT, ArrayTree
 
 
 def test_empty_board_is_not_a_win(board: Board):
@@ -45,6 +51,74 @@ def test_full_draw_board_is_not_a_win(board: Board):
     assert board.check_if_win_anywhere(team=Mark.O) == False
 
 
+def test_full_board_has_no_available_spaces(board: Board):
+    """
+    ======
+    X|O|X
+    O|X|X
+    O|X|O
+    ======
+    """
+    for pos in [Point(0,0), Point(0,2), Point(1,1), Point(1,2), Point(2,1)]:
+        board.set_mark(pos, Mark.X)
+    for pos in [Point(0,1), Point(1,0), Point(2,0)]:
+        board.set_mark(pos, Mark.O)
+    assert board.get_available_spaces() == [Point(2,2)]
+    assert board.is_full() == False
+    board.set_mark(Point(2,2), Mark.O)
+    assert board.get_available_spaces() == []
+    assert board.is_full() == True
+
+
+def test_bitboard_matches_board_display():
+    board = Board()
+    bitboard = BitBoard()
+    for pos, mark in [(Point(0,0), Mark.X), (Point(1,1), Mark.O), (Point(2,1), Mark.X)]:
+        board.set_mark(pos, mark)
+        bitboard.set_mark(pos, mark)
+    assert str(bitboard) == str(board)
+
+
+def test_win_lines_are_enumerated_once_per_board():
+    assert len(get_win_lines(3, 2, 3)) == 8
+    # 3D tic-tac-toe famously has 76 winning lines
+    assert len(get_win_lines(4, 3, 4)) == 76
+    # Each row has 11 five-in-a-row segments, in 4 directions
+    assert len(get_win_lines(15, 2, 5)) == 4 * 11 * 11 + 2 * 11 * 4
+
+
+def test_invalid_win_length_is_rejected(board_type: type):
+    with pytest.raises(ValueError):
+        board_type(board_size=3, win_length=4)
+
+
+def test_large_board_k_in_a_row_win(board_type: type):
+    """
+    Five in a row diagonally in the middle of a 15x15 board
+    """
+    board = board_type(board_size=15, win_length=5)
+    assert len(board.get_available_spaces()) == 15 * 15
+    for i in range(4):
+        assert board.set_mark(Point(5 + i, 9 - i), Mark.O) == False
+    assert board.check_if_win_anywhere(team=Mark.O) == False
+    assert board.set_mark(Point(9, 5), Mark.O) == True
+    assert board.check_if_win(last_placement=Point(7, 7), team=Mark.O) == True
+    assert board.check_if_win_anywhere(team=Mark.O) == True
+    assert board.check_if_win_anywhere(team=Mark.X) == False
+
+
+def test_3d_board_space_diagonal_win(board_type: type):
+    board = board_type(board_size=4, num_dimensions=3)
+    assert len(board.get_available_spaces()) == 4 ** 3
+    assert board.get_mark(Point(0, 0)) is None
+    for i in range(3):
+        board.set_mark(Point(i, 3 - i, (i,)), Mark.X)
+    assert board.check_if_win_anywhere(team=Mark.X) == False
+    assert board.set_mark(Point(3, 0, (3,)), Mark.X) == True
+    assert board.get_mark(Point(3, 0, (3,))) == Mark.X
+    assert "layers=(3,)" in str(board)
+
+
 def test_simple_vertical_win(board: Board):
     """
     ======
@@ -156,7 +230,7 @@ def test_mcts_ai_miss_win_error_pos(board: Board):
     board.set_mark(Point(1,1), Mark.O)
     state = GameState(board, player=Mark.O)
 
-    ai = MCTSAgent()
+    ai = MCTSAgent(seed=0)
     ai_action = ai.get_move(state, iterations=2, verbose=True)
     expected = Action(Point(2,2), player=Mark.O)
     assert ai_action == expected
@@ -181,7 +255,7 @@ def test_mcts_ai_miss_win_error_pos_2(board: Board):
     board.set_mark(Point(0,2), Mark.O)
     state = GameState(board, player=Mark.X)
 
-    ai = MCTSAgent()
+    ai = MCTSAgent(seed=0)
     ai_action = ai.get_move(state, verbose=True)
     expected = Action(Point(0,1), player=Mark.X)
     assert ai_action == expected
@@ -202,7 +276,7 @@ def test_mcts_ai_miss_win_error_pos_2_miss_winning_move(board: Board):
     board.set_mark(Point(0,2), Mark.O)
     state = GameState(board, player=Mark.O)
 
-    ai = MCTSAgent()
+    ai = MCTSAgent(seed=0)
     ai_action = ai.get_move(state, verbose=True)
     expected = Action(Point(0,1), player=Mark.O)
     assert ai_action == expected
@@ -227,6 +301,577 @@ def test_mcts_ai_error_pos_2_miss_state_score(board: Board):
     assert state.get_score(player=Mark.O) == 1.0
 
 
+def test_board_encoding_round_trips(board_type: type):
+    board = decode_board("X...O...x", board_type=board_type)
+    assert isinstance(board, board_type)
+    assert board.get_mark(Point(0,0)) == board.get_mark(Point(2,2)) == Mark.X
+    assert board.get_mark(Point(1,1)) == Mark.O
+    assert encode_board(board) == "X...O...X"
+
+    cube = decode_board("." * 26 + "O", num_dimensions=3, board_type=board_type)
+    assert cube.board_size == 3
+    assert cube.get_mark(Point(2,2,(2,))) == Mark.O
+    with pytest.raises(ValueError):
+        decode_board("X...O...")
+    with pytest.raises(ValueError):
+        decode_board("X...O...?")
+
+
+@pytest.mark.parametrize("num_dimensions", [2, 3])
+def test_board_copies_are_independent(board_type: type, num_dimensions: int):
+    board = board_type(3, num_dimensions)
+    board.set_mark(get_cell_points(3, num_dimensions)[0], Mark.X)
+    board_copy = copy.deepcopy(board)
+    board_copy.set_mark(get_cell_points(3, num_dimensions)[1], Mark.O)
+
+    assert board.get_mark(get_cell_points(3, num_dimensions)[1]) == Mark.BLANK
+    assert board_copy.get_mark(get_cell_points(3, num_dimensions)[0]) == Mark.X
+    assert board.zobrist_hash != board_copy.zobrist_hash
+
+
+def test_game_state_tracks_result_incrementally(board: Board):
+    """
+    ======
+    X|X|
+    O|O|
+     | |
+    ======
+    """
+    state = GameState(board, player=Mark.X)
+    assert state.move_count == 0 and state.num_empty == 9
+    for pos in [Point(0,0), Point(1,0), Point(0,1), Point(1,1)]:
+        state = state.get_next_state(Action(pos, state.player))
+    assert state.move_count == 4 and state.num_empty == 5
+    assert state.winner is None and not state.is_terminal()
+    assert state.get_score(Mark.X) == 0
+
+    winning_move = Action(Point(0,2), Mark.X)
+    state = state.get_next_state(winning_move)
+    assert state.last_move == winning_move
+    assert state.winner == Mark.X and state.is_terminal()
+    assert state.get_actions() == []
+    assert state.get_score(Mark.X) == 1.0
+    assert state.get_score(Mark.O) == 0.0
+
+
+def test_clearing_a_cell_is_never_a_win(board: Board):
+    assert board.set_mark(Point(1,1), Mark.BLANK) == False
+    board.set_mark(Point(1,1), Mark.X)
+    assert board.set_mark(Point(1,1), Mark.BLANK) == False
+
+
+def test_undo_action_restores_state(board: Board):
+    state = GameState(board, player=Mark.X)
+    state.apply_action(Action(Point(0,0), Mark.X))
+    board_before = str(state.board)
+    moves = [Point(1,0), Point(0,1), Point(1,1), Point(0,2)]
+    for pos in moves:
+        state.apply_action(Action(pos, state.player))
+    assert state.winner == Mark.X and state.num_empty == 4
+    for _ in moves:
+        state.undo_action()
+    assert str(state.board) == board_before
+    assert state.player == Mark.O
+    assert state.winner is None and state.num_empty == 8 and state.move_count == 1
+    assert state.last_move == Action(Point(0,0), Mark.X)
+
+
+def test_playout_leaves_state_unchanged(board: Board):
+    board.set_mark(Point(1,1), Mark.X)
+    state = GameState(board, player=Mark.O)
+    MCTSAgent().playout(state, Mark.X)
+    assert str(state.board) == str(board)
+    assert state.player == Mark.O and state.num_empty == 8
+
+
+def test_playout_scores(board: Board):
+    state = GameState(board, player=Mark.X)
+    assert get_playout_scores(state, Mark.X, 1.0, 0.0) == {Mark.X: 1.0, Mark.O: -1.0}
+    assert get_playout_scores(state, Mark.O, 0.0, 1.0) == {Mark.X: 0.0, Mark.O: 0.5}
+    assert get_playout_scores(state, Mark.X, 0.25, 0.5) == {Mark.X: 0.5, Mark.O: -0.25}
+
+
+def test_zobrist_hash_ignores_move_order(board_type: type):
+    board1 = board_type()
+    board1.set_mark(Point(0,0), Mark.X)
+    board1.set_mark(Point(1,1), Mark.O)
+    board1.set_mark(Point(2,2), Mark.X)
+    board2 = Board()
+    board2.set_mark(Point(2,2), Mark.X)
+    board2.set_mark(Point(1,1), Mark.O)
+    assert board2.get_hash_with_mark(Point(0,0), Mark.X) == board1.zobrist_hash
+    board2.set_mark(Point(0,0), Mark.X)
+    assert board1.zobrist_hash == board2.zobrist_hash
+    board2.set_mark(Point(0,0), Mark.BLANK)
+    assert board1.zobrist_hash != board2.zobrist_hash
+
+
+def test_transposition_table_shares_transposed_positions():
+    state = GameState(BitBoard(), player=Mark.X)
+    ai = MCTSAgent(transposition_table_size=50, seed=0)
+    ai.get_move(state, iterations=500)
+    assert len(ai.transposition_table) == 50
+
+    # X at 0,0 then 2,2 reaches the same position as X at 2,2 then 0,0
+    order1 = [Action(Point(0,0), Mark.X), Action(Point(1,1), Mark.O), Action(Point(2,2), Mark.X)]
+    order2 = [order1[2], order1[1], order1[0]]
+    for action in order1:
+        state.apply_action(action)
+    key1 = state.get_hash()
+    for action in order1:
+        state.undo_action()
+    for action in order2:
+        state.apply_action(action)
+    assert state.get_hash() == key1
+    node = ai.transposition_table.get_or_create(key1, order1[2])
+    assert ai.transposition_table.get_or_create(key1, order2[2]) is node
+
+
+def test_mcts_ai_with_transposition_table_finds_win(win_state: GameState):
+    ai = MCTSAgent(transposition_table_size=10_000, seed=0)
+    ai_action = ai.get_move(win_state)
+    expected = Action(Point(0,1), player=Mark.O)
+    assert ai_action == expected
+
+
+def test_symmetric_spaces_are_searched_once(board: Board):
+    """
+    ======
+     | |
+     |X|
+     | |
+    ======
+    """
+    symmetries = get_board_symmetries(3, 2)
+    assert len(symmetries.permutations) == 8
+    assert symmetries.get_unique_spaces(board) == [Point(0,0), Point(0,1), Point(1,1)]
+    board.set_mark(Point(1,1), Mark.X)
+    assert symmetries.get_unique_spaces(board) == [Point(0,0), Point(0,1)]
+    state = GameState(board, player=Mark.O)
+    assert len(state.get_unique_actions()) == 2
+
+
+def test_canonical_form_matches_rotated_boards(board_type: type):
+    """
+    ======        ======
+    X|O|           | |X
+     | |    ==     | |O
+     | |           | |
+    ======        ======
+    """
+    board1 = board_type()
+    board1.set_mark(Point(0,0), Mark.X)
+    board1.set_mark(Point(0,1), Mark.O)
+    board2 = board_type()
+    board2.set_mark(Point(0,2), Mark.X)
+    board2.set_mark(Point(1,2), Mark.O)
+    symmetries = get_board_symmetries(3, 2)
+    hash1, symmetry1 = symmetries.get_canonical_form(board1)
+    hash2, symmetry2 = symmetries.get_canonical_form(board2)
+    assert hash1 == hash2
+    # The same canonical move maps back to matching moves on each real board
+    canonical_move = symmetries.transform_point(Point(2,2), symmetry1)
+    assert symmetries.untransform_point(canonical_move, symmetry2) == Point(2,0)
+    assert symmetries.get_canonical_hash_with_mark(
+        symmetries.get_symmetric_hashes(board1), Point(2,2), Mark.X
+    ) == symmetries.get_canonical_hash_with_mark(
+        symmetries.get_symmetric_hashes(board2), Point(2,0), Mark.X
+    )
+
+
+def test_cube_board_symmetries():
+    symmetries = get_board_symmetries(4, 3)
+    assert len(symmetries.permutations) == 48
+    # Corners, edges, face centers and the inner cube
+    assert len(symmetries.get_unique_spaces(BitBoard(board_size=4, num_dimensions=3))) == 4
+
+
+@pytest.mark.parametrize("transposition_table_size", [None, 10_000])
+def test_mcts_ai_with_symmetries_blocks_win(block_state: GameState, transposition_table_size: int):
+    ai = MCTSAgent(transposition_table_size=transposition_table_size, use_symmetries=True, seed=0)
+    ai_action = ai.get_move(block_state)
+    expected = Action(Point(0,1), player=Mark.X)
+    assert ai_action == expected
+
+
+@pytest.mark.parametrize("agent_options", [{}, {"num_workers": 2, "parallel_mode": "tree"}])
+def test_mcts_ai_reuses_tree_between_moves(board: Board, agent_options: dict):
+    state = GameState(board, player=Mark.X)
+    ai = MCTSAgent(reuse_tree=True, seed=0, **agent_options)
+    ai_action = ai.get_move(state, iterations=500)
+    assert ai.root.num_nodes == count_nodes(ai.root)
+    state = state.get_next_state(ai_action)
+    reply = Action(state.get_actions()[0].pos, Mark.O)
+    kept_visits = ai.root.children[ai_action].children[reply].times_visited
+    state = state.get_next_state(reply)
+
+    result = ai.get_move_with_budget(state, SearchBudget(iterations=100, early_stop=False))
+    assert ai.root.action == reply
+    assert ai.root.times_visited >= kept_visits + 100
+    assert result.num_nodes == ai.root.num_nodes == count_nodes(ai.root)
+
+    # An unrelated position starts a fresh tree
+    ai.get_move(GameState(Board(), player=Mark.O), iterations=100)
+    assert ai.root.action is None
+
+
+def test_root_parallel_mcts_merges_worker_searches(win_state: GameState):
+    ai = MCTSAgent(num_workers=2, seed=0)
+    try:
+        root = ai.search(win_state, iterations=300)
+        ai_action = ai.get_move(win_state, iterations=300)
+    finally:
+        ai.close()
+    # Each worker's root children are visited once per iteration
+    assert sum(child.times_visited for child in root.children.values()) == 2 * 300
+    assert ai_action == Action(Point(0,1), player=Mark.O)
+
+
+def test_tree_parallel_mcts_shares_one_tree(win_state: GameState):
+    ai = MCTSAgent(num_workers=4, parallel_mode="tree")
+    root = ai.search(win_state, iterations=1000)
+    assert sum(child.times_visited for child in root.children.values()) == 1000
+    assert all(child.virtual_losses == 0 for child in root.children.values())
+    assert root.num_nodes == count_nodes(root)
+    assert ai.get_move(win_state) == Action(Point(0,1), player=Mark.O)
+
+    result = ai.get_move_with_budget(win_state, SearchBudget(iterations=200))
+    assert result.iterations == 200
+
+
+def test_virtual_loss_steers_selection_away():
+    parent = MCTSNode()
+    parent.times_visited = 10
+    for pos in [Point(0,0), Point(0,1)]:
+        child = MCTSNode(Action(pos, Mark.X))
+        child.times_visited = 5
+        child.total_score = 2.5
+        parent.children[child.action] = child
+    busy_child = parent.get_best_child()
+    busy_child.virtual_losses += 1
+    assert parent.get_best_child() is not busy_child
+
+
+@pytest.mark.parametrize("agent_options", [
+    {"transposition_table_size": 1000},
+    {"use_solver": True},
+    {"use_rave": True},
+    {"hooks": SearchRecorder()},
+])
+def test_tree_parallel_rejects_unsupported_options(agent_options: dict):
+    with pytest.raises(ValueError):
+        MCTSAgent(num_workers=2, parallel_mode="tree", **agent_options)
+
+
+@pytest.mark.parametrize("agent_options", [
+    {"use_solver": True, "transposition_table_size": 1000},
+    {"use_solver": True, "use_array_tree": True},
+    {"use_rave": True, "transposition_table_size": 1000},
+    {"use_rave": True, "use_array_tree": True},
+    {"opening_book_path": "book.ob", "transposition_table_size": 1000},
+    {"opening_book_path": "book.ob", "use_array_tree": True},
+    {"reuse_tree": True, "num_workers": 2},
+])
+def test_mcts_ai_rejects_unsupported_options(agent_options: dict):
+    with pytest.raises(ValueError):
+        MCTSAgent(**agent_options)
+
+
+def test_importing_agents_doesnt_load_array_trees():
+    code = "import sys, agents; print('array_tree' in sys.modules, 'numpy' in sys.modules)"
+    output = subprocess.run(
+        [sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True, check=True).stdout
+    assert output.split() == ["False", "False"]
+
+
+def test_array_tree_grows_by_chunks():
+    tree = ArrayTree(chunk_size=4)
+    assert tree.capacity == 4 and tree.num_nodes == 1
+    tree.expand(ROOT, [0, 4, 8, 2, 6])
+    assert list(tree.get_children(ROOT)) == [1, 2, 3, 4, 5]
+    assert tree.capacity == 8
+    assert [tree.action_cells[child] for child in tree.get_children(ROOT)] == [0, 4, 8, 2, 6]
+    assert tree.memory_usage() == 8 * tree.bytes_per_node
+    tree.update(3, 1.0)
+    assert tree.get_best_child(ROOT) == 1
+    for child in [1, 2, 4, 5]:
+        tree.update(child, 0.0)
+    tree.update(ROOT, 0.0)
+    assert tree.get_best_child(ROOT) == 3
+
+
+def test_array_tree_vectorized_selection_matches_loop():
+    pytest.importorskip("numpy")
+    rng = random.Random(0)
+    tree = ArrayTree(chunk_size=64)
+    tree.expand(ROOT, list(range(225)))
+    assert tree.get_best_child(ROOT, vectorized=True) == 1
+    for child in tree.get_children(ROOT):
+        for _ in range(rng.randint(1, 20)):
+            tree.update(child, rng.choice([0.0, 0.5, 1.0]))
+            tree.update(ROOT, 0.0)
+    assert tree.get_best_child(ROOT, vectorized=True) == tree.get_best_child(ROOT, vectorized=False)
+
+
+def test_best_child_matches_utc1_scores():
+    rng = random.Random(0)
+    parent = MCTSNode()
+    for col in range(15):
+        child = MCTSNode(Action(Point(0, col), Mark.X))
+        child.times_visited = rng.randint(1, 20)
+        child.total_score = rng.uniform(0, child.times_visited)
+        parent.children[child.action] = child
+        parent.times_visited += child.times_visited
+    expected = max(parent.children.values(), key=lambda child: child.utc1_score(parent.times_visited))
+    assert parent.get_best_child() is expected
+
+
+def test_mcts_ai_with_array_tree_finds_win(win_state: GameState):
+    ai = MCTSAgent(use_array_tree=True, seed=0)
+    ai_action = ai.get_move(win_state)
+    assert ai_action == Action(Point(0,1), player=Mark.O)
+    # The root is visited as many times as in an MCTSNode tree
+    assert ai.array_tree.times_visited[ROOT] == MCTSAgent(seed=0).search(win_state, 1000).times_visited
+    assert ai.array_tree.bytes_per_node < 32
+
+
+def test_budgeted_search_stops_at_time_limit(board: Board):
+    state = GameState(board, player=Mark.X)
+    result = MCTSAgent().get_move_with_budget(
+        state, SearchBudget(time_limit=0.2, early_stop=False))
+    assert result.stop_reason == StopReason.TIME
+    assert result.elapsed >= 0.2
+    assert result.iterations > 0
+    assert result.action in state.get_actions()
+
+
+@pytest.mark.parametrize("agent_options", [{}, {"use_array_tree": True}, {"transposition_table_size": 10_000}])
+def test_budgeted_search_stops_at_node_limit(agent_options: dict):
+    state = GameState(BitBoard(), player=Mark.X)
+    result = MCTSAgent(**agent_options).get_move_with_budget(
+        state, SearchBudget(iterations=10_000, max_nodes=100))
+    assert result.stop_reason == StopReason.NODES
+    assert 100 <= result.num_nodes < 110
+    assert result.iterations < 10_000
+
+
+def test_budgeted_search_stops_when_asked():
+    calls = []
+    def should_stop() -> bool:
+        calls.append(None)
+        return len(calls) >= 10
+
+    state = GameState(BitBoard(), player=Mark.X)
+    result = MCTSAgent().get_move_with_budget(
+        state, SearchBudget(iterations=10_000, should_stop=should_stop))
+    assert result.stop_reason == StopReason.STOPPED
+    assert result.iterations == 10
+
+
+def test_budgeted_search_stops_at_memory_limit():
+    state = GameState(BitBoard(), player=Mark.X)
+    ai = MCTSAgent(use_array_tree=True, seed=0)
+    result = ai.get_move_with_budget(state, SearchBudget(max_memory_bytes=20_000))
+    assert result.stop_reason == StopReason.MEMORY
+    assert result.num_nodes * ai.array_tree.bytes_per_node >= 20_000
+
+
+def test_budgeted_search_stops_once_move_is_decided():
+    """
+    ======
+    X|X|
+    O|O|X
+    X|O|
+    ======
+    X wins at 0,2; 2,2 can only draw
+    """
+    board = BitBoard()
+    for pos in [Point(0,0), Point(0,1), Point(1,2), Point(2,0)]:
+        board.set_mark(pos, Mark.X)
+    for pos in [Point(1,0), Point(1,1), Point(2,1)]:
+        board.set_mark(pos, Mark.O)
+    state = GameState(board, player=Mark.X)
+
+    result = MCTSAgent().get_move_with_budget(state, SearchBudget(iterations=10_000))
+    assert result.stop_reason == StopReason.DECIDED
+    assert result.iterations < 10_000
+    assert result.action == Action(Point(0,2), Mark.X)
+
+
+def test_proven_scores_propagate_minimax_style():
+    parent = MCTSNode(Action(Point(0,0), Mark.X))
+    replies = [MCTSNode(Action(Point(0, col), Mark.O)) for col in (1, 2)]
+    parent.children = {reply.action: reply for reply in replies}
+    parent.update_proven_score()
+    assert parent.proven_score is None
+
+    replies[0].proven_score = 0.5
+    parent.update_proven_score()
+    assert parent.proven_score is None
+    assert parent.get_best_child(skip_solved=True) is replies[1]
+
+    replies[1].proven_score = 0.0
+    parent.update_proven_score()
+    assert parent.proven_score == 0.5
+
+    replies[1].proven_score = 1.0
+    parent.update_proven_score()
+    assert parent.proven_score == 0.0
+
+
+def test_mcts_solver_stops_once_root_is_solved(block_state: GameState):
+    ai = MCTSAgent(use_solver=True)
+    result = ai.get_move_with_budget(block_state, SearchBudget(iterations=100_000))
+    assert result.stop_reason == StopReason.SOLVED
+    assert result.iterations < 1000
+    assert result.action == Action(Point(0,1), player=Mark.X)
+
+
+def test_mcts_solver_finds_win_quickly(win_state: GameState):
+    root = MCTSAgent(use_solver=True).search(win_state, iterations=1000)
+    assert root.proven_score is not None
+    assert root.children[Action(Point(0,1), Mark.O)].proven_score == 1.0
+    assert sum(child.times_visited for child in root.children.values()) < 50
+
+
+@pytest.mark.parametrize("use_solver,use_rave", [(False, False), (True, False), (False, True)])
+def test_profiled_search_matches_unprofiled_search(use_solver: bool, use_rave: bool):
+    state = GameState(BitBoard(), Mark.X)
+    trees = []
+    for hooks in [None, SearchRecorder()]:
+        agent = MCTSAgent(use_solver=use_solver, use_rave=use_rave, hooks=hooks, seed=5)
+        root = agent.search(state, iterations=300)
+        trees.append({
+            action: (child.times_visited, child.total_score, child.proven_score, child.amaf_visits, child.amaf_score)
+            for action, child in root.children.items()
+        })
+    assert trees[0] == trees[1]
+
+
+def _get_root_stats(agent: MCTSAgent, state: GameState, iterations: int) -> dict:
+    root = agent.search(state, iterations)
+    return {action: (child.times_visited, child.total_score) for action, child in root.children.items()}
+
+
+@pytest.mark.parametrize("agent_options", [
+    {},
+    {"use_rave": True},
+    {"rollout_policy": "win-block"},
+    {"transposition_table_size": 1000},
+    {"use_array_tree": True},
+    {"num_workers": 2},
+])
+def test_same_seed_gives_same_search(agent_options: dict):
+    state = GameState(BitBoard(), Mark.X)
+    agents = [MCTSAgent(seed=3, **agent_options) for _ in range(2)]
+    try:
+        assert _get_root_stats(agents[0], state, 200) == _get_root_stats(agents[1], state, 200)
+        assert agents[0].get_move(state, 200) == agents[1].get_move(state, 200)
+    finally:
+        for agent in agents:
+            agent.close()
+
+
+def test_reseeding_repeats_search():
+    state = GameState(BitBoard(), Mark.X)
+    agent = MCTSAgent()
+    agent.seed(7)
+    first_stats = _get_root_stats(agent, state, 200)
+    assert _get_root_stats(agent, state, 200) != first_stats
+    agent.seed(7)
+    assert _get_root_stats(agent, state, 200) == first_stats
+
+
+def test_random_ai_agent_is_seedable():
+    state = GameState(BitBoard(), Mark.X)
+    moves = [[agent.get_move(state) for _ in range(10)] for agent in (RandomAIAgent(1), RandomAIAgent(1))]
+    assert moves[0] == moves[1]
+
+
+def test_update_amaf():
+    state = GameState(BitBoard(), Mark.X)
+    node = MCTSNode()
+    node.expand(state)
+    later_actions = {Action(Point(0,0), Mark.X), Action(Point(1,1), Mark.O), Action(Point(2,2), Mark.X)}
+    node.update_amaf(later_actions, {Mark.X: 1.0, Mark.O: -1.0})
+
+    assert node.children[Action(Point(0,0), Mark.X)].amaf_visits == 1
+    assert node.children[Action(Point(0,0), Mark.X)].amaf_score == 1.0
+    assert node.children[Action(Point(2,2), Mark.X)].amaf_score == 1.0
+    # The root's children are X's moves, so O's move doesn't count
+    assert node.children[Action(Point(1,1), Mark.X)].amaf_visits == 0
+    assert sum(child.amaf_visits for child in node.children.values()) == 2
+
+
+def test_rave_search_finds_block():
+    """
+    =========
+     | | | |
+     |O| | |
+    X|X|X| |
+     |O| | |
+     | | | |
+    =========
+    """
+    state = GameState(decode_board(".....O....XXX...O........", win_length=4), Mark.O)
+    root = MCTSAgent(use_rave=True, seed=0).search(state, iterations=800)
+    assert max(root.children.values(), key=lambda child: child.times_visited).action.pos == Point(2,3)
+    assert all(child.amaf_visits > child.times_visited for child in root.children.values())
+
+
+def test_search_recorder_profiles_and_samples_search():
+    recorder = SearchRecorder(sample_interval=100, max_variation_length=3)
+    state = GameState(BitBoard(), Mark.X)
+    root = MCTSAgent(hooks=recorder).search(state, iterations=500)
+
+    profile, = recorder.profiles
+    assert profile.iterations == profile.playouts == 500
+    assert profile.num_nodes > profile.expansions > 0
+    assert 0 < profile.average_depth <= profile.max_depth
+    assert 0 < profile.average_playout_length <= 9
+    assert profile.nodes_per_second > 0
+    assert 0 < profile.selection_time + profile.playout_time + profile.backup_time < profile.elapsed
+    assert profile.to_dict()["iterations_per_second"] == profile.iterations_per_second
+
+    # Samples every 100 iterations, plus one at the end
+    assert [sample["iteration"] for sample in recorder.samples] == [100, 200, 300, 400, 500, 500]
+    final = recorder.samples[-1]
+    assert len(final["principal_variation"]) == 3
+    best_child = max(root.children.values(), key=lambda child: child.times_visited)
+    assert final["principal_variation"][0] == {
+        "pos": list(best_child.action.pos.coords), "player": "X",
+        "visits": best_child.times_visited, "average_score": best_child.average_score()}
+    distribution = final["visit_distribution"]
+    assert [move["visits"] for move in distribution] == sorted(
+        (child.times_visited for child in root.children.values()), reverse=True)
+    assert sum(move["fraction"] for move in distribution) == pytest.approx(1.0)
+
+
+@pytest.mark.parametrize("agent_options", [
+    {"transposition_table_size": 1000},
+    {"use_array_tree": True},
+])
+def test_search_hooks_called_in_every_search_mode(agent_options: dict):
+    calls = []
+
+    class Hooks(SearchHooks):
+        def on_search_start(self, state):
+            calls.append("start")
+
+        def on_iteration(self, root, profile):
+            calls.append("iteration")
+
+        def on_search_end(self, root, profile):
+            calls.append(("end", profile.iterations, len(root.children)))
+
+    state = GameState(BitBoard(), Mark.X)
+    MCTSAgent(hooks=Hooks(), **agent_options).search(state, iterations=20)
+    assert calls[0] == "start"
+    assert calls[-1] == ("end", 20, 9)
+    assert calls.count("iteration") == 20
+
+
 def test_mcts_ai_miss_win_error_pos_3(board: Board):
     """
     ======
@@ -240,7 +885,7 @@ def test_mcts_ai_miss_win_error_pos_3(board: Board):
     board.set_mark(Point(2,2), Mark.O)
     state = GameState(board, player=Mark.O)
 
-    ai = MCTSAgent()
+    ai = MCTSAgent(seed=0)
     ai_action = ai.get_move(state, verbose=True)
     expected = Action(Point(2,0), player=Mark.O)
     assert ai_action == expected
@@ -261,7 +906,7 @@ def test_mcts_ai_miss_win_error_pos_4(board: Board):
     board.set_mark(Point(2,2), Mark.O)
     state = GameState(board, player=Mark.O)
 
-    ai = MCTSAgent()
+    ai = MCTSAgent(seed=0)
     ai_action = ai.get_move(state, verbose=True)
     expected = Action(Point(1,0), player=Mark.O)
     assert ai_action == expected
@@ -0,0 +1,97 @@
+import pytest
+
+from agents import Action, GameState, MCTSAgent
+from game import BitBoard, Board, Mark, Point
+from opening_book import (
+    OpeningBook, get_book_entries, merge_opening_books, write_opening_book)
+
+
+@pytest.fixture(scope="module")
+def searched_tree():
+    state = GameState(BitBoard(), Mark.X)
+    root = MCTSAgent(use_symmetries=True).search(state, iterations=2000)
+    return root, state
+
+
+def test_book_entries_match_tree(searched_tree):
+    root, state = searched_tree
+    entries = get_book_entries(root, state, max_depth=1)
+    # Only the center, a corner and an edge are searched from an empty board
+    assert len(entries) == 3
+    assert sorted(entries.values()) == sorted(
+        (child.times_visited, child.total_score) for child in root.children.values())
+
+
+def test_book_lookups_are_symmetric(tmp_path, searched_tree):
+    root, state = searched_tree
+    path = str(tmp_path / "book.ob")
+    write_opening_book(path, root, state, max_depth=3)
+    with OpeningBook(path) as book:
+        assert len(book) == len(get_book_entries(root, state, max_depth=3))
+
+        corner_actions = [Action(point, Mark.X) for point in [
+            Point(0,0), Point(0,2), Point(2,0), Point(2,2)]]
+        priors = book.get_priors(state, corner_actions)
+        assert len(set(priors.values())) == 1
+        corner_child = next(
+            child for action, child in root.children.items() if action in corner_actions)
+        assert priors[corner_actions[0]] == (corner_child.times_visited, corner_child.total_score)
+
+        # Positions deeper than the book, or on other boards, have no entries
+        deep_state = GameState(BitBoard(), Mark.X)
+        for point, mark in [(Point(0,0), Mark.X), (Point(1,1), Mark.O), (Point(2,2), Mark.X)]:
+            deep_state.apply_action(Action(point, mark))
+        assert book.get_priors(deep_state, deep_state.get_actions()) == {}
+        big_state = GameState(BitBoard(board_size=4), Mark.X)
+        assert book.get_priors(big_state, big_state.get_actions()) == {}
+
+
+def test_merging_books_adds_stats(tmp_path, searched_tree):
+    root, state = searched_tree
+    path = str(tmp_path / "book.ob")
+    write_opening_book(path, root, state, max_depth=2)
+    with OpeningBook(path) as book:
+        single = dict(book)
+
+    # Writing again merges into the existing book
+    write_opening_book(path, root, state, max_depth=2)
+    with OpeningBook(path) as book:
+        doubled = dict(book)
+    assert doubled == {
+        key: (2 * times_visited, 2 * total_score)
+        for key, (times_visited, total_score) in single.items()
+    }
+
+    other_path = str(tmp_path / "other.ob")
+    write_opening_book(other_path, root, state, max_depth=2)
+    merge_opening_books(path, [path, other_path])
+    with OpeningBook(path) as book:
+        tripled = list(book)
+    assert [key for key, _ in tripled] == sorted(single)
+    assert dict(tripled) == {
+        key: (3 * times_visited, 3 * total_score)
+        for key, (times_visited, total_score) in single.items()
+    }
+
+    big_path = str(tmp_path / "big.ob")
+    big_state = GameState(Board(board_size=4), Mark.X)
+    write_opening_book(big_path, MCTSAgent().search(big_state, 50), big_state)
+    with pytest.raises(ValueError):
+        merge_opening_books(path, [path, big_path])
+
+
+def test_mcts_ai_starts_from_opening_book(tmp_path, searched_tree):
+    root, state = searched_tree
+    path = str(tmp_path / "book.ob")
+    write_opening_book(path, root, state)
+
+    with MCTSAgent(use_symmetries=True, opening_book_path=path) as ai:
+        warm_root = ai.search(state, iterations=10)
+        assert sum(child.times_visited for child in warm_root.children.values()) == (
+            sum(child.times_visited for child in root.children.values()) + 10)
+        for action, child in warm_root.children.items():
+            assert child.times_visited >= root.children[action].times_visited
+        assert ai.get_best_move(warm_root) == ai.get_best_move(root)
+    # Closing the agent closes its book
+    with pytest.raises(ValueError):
+        ai.search(state, iterations=10)
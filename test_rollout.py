@@ -0,0 +1,77 @@
+import pytest
+
+from agents import Action, GameState, MCTSAgent
+from game import BitBoard, Mark, Point, decode_board, encode_board
+from rollout import (
+    ROLLOUT_POLICIES, RandomRollout, WinBlockRollout, _LineCounts, get_rollout_policy)
+
+
+def test_line_counts_track_threats():
+    state = GameState(decode_board("XX.OO...."), Mark.X)
+    lines = _LineCounts(state)
+    assert [lines.get_empty_cell(line_id) for line_id in lines.threats[Mark.X]] == [2]
+    assert [lines.get_empty_cell(line_id) for line_id in lines.threats[Mark.O]] == [5]
+
+    # X blocking O's row also ends O's threat
+    assert not lines.place(lines.empty_cells.index(5), Mark.X)
+    assert not lines.threats[Mark.O]
+    assert lines.place(lines.empty_cells.index(2), Mark.X)
+
+
+@pytest.mark.parametrize("policy_name", list(ROLLOUT_POLICIES))
+def test_rollouts_leave_state_unchanged(policy_name: str):
+    policy = get_rollout_policy(policy_name)
+    state = GameState(decode_board("X...O...."), Mark.X)
+    for _ in range(20):
+        scores, num_moves = policy.playout(state, Mark.X)
+        assert 0 <= scores[Mark.X] <= 1
+        assert 0 < num_moves <= 7
+    assert encode_board(state.board) == "X...O...."
+
+
+def test_last_move_rollout_matches_game_result():
+    # X's last move wins
+    state = GameState(decode_board("OXOOXXX.O"), Mark.X)
+    for policy in (RandomRollout(), WinBlockRollout()):
+        assert policy.playout(state, Mark.X) == ({Mark.O: -1.0, Mark.X: 1.0}, 1)
+        assert policy.playout(state, Mark.O)[0][Mark.O] == 0.0
+
+
+def test_win_block_rollout_takes_wins_and_blocks():
+    # X can win straight away instead of blocking O
+    state = GameState(decode_board("XX.OO...."), Mark.X)
+    for _ in range(20):
+        assert WinBlockRollout().playout(state, Mark.X) == ({Mark.O: -1.0, Mark.X: 1.0}, 1)
+
+    # O has to block X's row, then X has to block O's diagonal, ... which
+    # always ends in a draw
+    state = GameState(decode_board("XX..O...."), Mark.O)
+    for _ in range(20):
+        scores, _ = WinBlockRollout().playout(state, Mark.X)
+        assert scores[Mark.X] == 0.5
+
+
+def test_capped_rollout_scores_cutoff_positions():
+    # O has two ways to win and X can only block one
+    state = GameState(decode_board("O.O.X.O.X"), Mark.X)
+    assert RandomRollout(max_moves=0).playout(state, Mark.O) == ({Mark.O: 1.0, Mark.X: -1.0}, 0)
+
+    state = GameState(decode_board("....X...."), Mark.O)
+    scores, num_moves = RandomRollout(max_moves=0).playout(state, Mark.X)
+    assert num_moves == 0
+    assert scores[Mark.X] == 1.0 and scores[Mark.O] == -1.0
+    scores, _ = RandomRollout(max_moves=0).playout(GameState(BitBoard(), Mark.X), Mark.X)
+    assert scores[Mark.X] == 0.5
+
+
+def test_unknown_rollout_policy():
+    with pytest.raises(ValueError):
+        MCTSAgent(rollout_policy="minimax")
+    with pytest.raises(ValueError):
+        MCTSAgent(rollout_policy="win-block", playout_batch_size=16)
+
+
+def test_mcts_ai_with_win_block_rollouts_blocks_win():
+    state = GameState(decode_board(".....O....XXX...O........", win_length=4), Mark.O)
+    ai = MCTSAgent(rollout_policy="win-block", seed=0)
+    assert ai.get_move(state, iterations=1000) == Action(Point(2,3), Mark.O)
@@ -0,0 +1,107 @@
+import asyncio
+import time
+
+import pytest
+
+from agents import Action, GameState, SearchBudget, StopReason
+from game import BitBoard, Mark, Point, decode_board
+from service import AgentService, handle_message
+
+
+def _run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_get_move_async_blocks_win():
+    async def get_move():
+        async with AgentService(num_workers=1) as service:
+            state = GameState(decode_board("..O.XXX.O"), Mark.O)
+            return await service.get_move_async(state, SearchBudget(iterations=500))
+
+    result = _run(get_move())
+    assert result.action == Action(Point(1,0), Mark.O)
+    assert result.stop_reason in (StopReason.ITERATIONS, StopReason.DECIDED)
+
+
+def test_requests_are_queued_fairly_across_games():
+    async def run_requests():
+        order = []
+        async with AgentService(num_workers=1, max_concurrent=1) as service:
+            state = GameState(BitBoard(), Mark.X)
+
+            async def request(game_id: str, name: str):
+                await service.get_move_async(state, SearchBudget(iterations=20), game_id)
+                order.append(name)
+                assert service.num_running <= 1
+
+            # Game "a" asks for several moves before "b" asks for one, but
+            # "b" goes next since "a" was just served
+            await asyncio.gather(
+                request("a", "a1"), request("a", "a2"), request("a", "a3"), request("b", "b1"))
+        return order
+
+    assert _run(run_requests()) == ["a1", "b1", "a2", "a3"]
+
+
+def test_cancelling_game_stops_its_searches():
+    async def cancel_search():
+        async with AgentService(num_workers=1, max_concurrent=1) as service:
+            state = GameState(BitBoard(), Mark.X)
+            long_budget = SearchBudget(iterations=10**8, early_stop=False)
+            running = asyncio.ensure_future(service.get_move_async(state, long_budget, "ended"))
+            waiting = asyncio.ensure_future(service.get_move_async(state, long_budget, "ended"))
+            await asyncio.sleep(0.5)
+            assert (service.num_running, service.num_waiting) == (1, 1)
+
+            service.cancel_game("ended")
+            for task in (running, waiting):
+                with pytest.raises(asyncio.CancelledError):
+                    await task
+            # The worker stops the cancelled search, so it's free again quickly
+            start = time.perf_counter()
+            await service.get_move_async(state, SearchBudget(iterations=20), "other")
+            return time.perf_counter() - start
+
+    assert _run(cancel_search()) < 10
+
+
+def test_handle_message():
+    async def handle_messages():
+        async with AgentService(num_workers=1) as service:
+            return await asyncio.gather(
+                handle_message(service, {"id": 1, "board": "XX.OO....", "player": "x", "iterations": 200}),
+                handle_message(service, {"id": 2, "board": "XXXOO...."}),
+                handle_message(service, {"id": 3, "board": "XX?OO...."}),
+                handle_message(service, {"cancel": "a"}),
+            )
+
+    move, game_over, invalid, cancel = _run(handle_messages())
+    assert move["id"] == 1
+    assert move["move"] == [0, 2]
+    assert move["iterations"] <= 200
+    assert "error" in game_over and "error" in invalid
+    assert cancel is None
+
+
+def test_service_rejects_parallel_agents():
+    with pytest.raises(ValueError):
+        AgentService({"num_workers": 2})
+
+
+def test_handle_message_rejects_bad_fields():
+    async def handle_messages():
+        async with AgentService(num_workers=1) as service:
+            return await asyncio.gather(
+                handle_message(service, {"id": 1, "board": "XX.OO....", "iterations": "abc"}),
+                handle_message(service, {"id": 2, "board": "XX.OO....", "time_limit": -1}),
+                handle_message(service, {"id": 3, "board": "XX.OO....", "player": "BLANK"}),
+                handle_message(service, {"id": 4, "board": "XX.OO....", "dimensions": "abc"}),
+                handle_message(service, ["not", "an", "object"]),
+            )
+
+    responses = _run(handle_messages())
+    assert [response["id"] for response in responses] == [1, 2, 3, 4, None]
+    assert all(response["error"].startswith("invalid request") for response in responses[:3])
+    # Unexpected errors still get an error response rather than escaping
+    assert responses[3]["error"].startswith("request failed")
+    assert "move" not in responses[3]
@@ -0,0 +1,68 @@
+import pytest
+
+from agents import Action, GameState, MCTSAgent
+from game import BitBoard, Board, Mark, Point
+from tablebase import Outcome, Tablebase, TablebaseAgent, build_tablebase
+
+
+@pytest.fixture(scope="module")
+def tablebase_path(tmp_path_factory) -> str:
+    path = str(tmp_path_factory.mktemp("tablebase") / "ttt3.tb")
+    # Tic-tac-toe famously has 765 positions up to symmetry
+    assert build_tablebase(path, board_size=3) == 765
+    return path
+
+
+def test_empty_board_is_a_draw(tablebase_path: str):
+    with Tablebase(tablebase_path) as tablebase:
+        assert tablebase.probe(GameState(Board(), Mark.X)) == (Outcome.DRAW, 9)
+        # X always moves first, so O can't be the one to move here
+        assert tablebase.probe(GameState(Board(), Mark.O)) is None
+        assert tablebase.probe(GameState(Board(board_size=4), Mark.X)) is None
+
+
+def test_symmetric_positions_have_the_same_result(tablebase_path: str):
+    """
+    ======        ======
+    X| |           | |
+     |O|    ==     |O|
+     | |           | |X
+    ======        ======
+    """
+    results = []
+    with Tablebase(tablebase_path) as tablebase:
+        for corner in [Point(0,0), Point(2,2)]:
+            board = BitBoard()
+            board.set_mark(corner, Mark.X)
+            board.set_mark(Point(1,1), Mark.O)
+            results.append(tablebase.probe(GameState(board, Mark.X)))
+    assert results[0] == results[1] == (Outcome.DRAW, 7)
+
+
+def test_tablebase_agent_plays_perfectly(tablebase_path: str, win_state: GameState):
+    with Tablebase(tablebase_path) as tablebase:
+        assert tablebase.probe(win_state) == (Outcome.WIN, 1)
+    with TablebaseAgent(tablebase_path) as agent:
+        assert agent.get_move(win_state) == Action(Point(0,1), Mark.O)
+    with pytest.raises(ValueError):
+        agent.tablebase.probe(win_state)
+
+
+def test_mcts_ai_with_tablebase_leaves_blocks_win(tablebase_path: str):
+    """
+    ======
+     | |O
+     |X|X
+    X| |O
+    ======
+    """
+    board = BitBoard()
+    board.set_mark(Point(1,1), Mark.X)
+    board.set_mark(Point(1,2), Mark.X)
+    board.set_mark(Point(2,0), Mark.X)
+    board.set_mark(Point(0,2), Mark.O)
+    board.set_mark(Point(2,2), Mark.O)
+    state = GameState(board, player=Mark.O)
+
+    with MCTSAgent(tablebase_path=tablebase_path) as ai:
+        assert ai.get_move(state, iterations=50) == Action(Point(1,0), Mark.O)